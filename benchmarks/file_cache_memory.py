@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Compares the memory usage of the old FileCache layout (one list of paths per key and level)
+with the current one (path table + integer IDs) on a synthetic tree.
+No files are created, the paths are only generated in memory.
+
+Usage: python3 benchmarks/file_cache_memory.py [FILE_COUNT]
+"""
+import argparse
+import os
+from pathlib import Path
+import random
+import time
+import tracemalloc
+# local
+from mkdocs_crosslink_plugin.file_cache import FileCache, MultiValueDict, get_key_directory, normalize_path_str, split_pattern
+
+EXTENSIONS = [".md", ".html", ".png", ".min.js", ".js", ".css", ".tar.gz"]
+
+
+class OldLayoutFileCache:
+    """
+    The layout used before the path table was introduced: every level stores lists of paths
+    """
+    def __init__(self, relative_paths: list[str], max_extension_count: int = 5) -> None:
+        self._caches = [MultiValueDict() for _ in range(max_extension_count)]
+        for path_str in relative_paths:
+            path_str = normalize_path_str(path_str)
+            name = os.path.basename(path_str)
+            if name == "index.md" or name == "index.html":
+                self._caches[0].append(f"{os.path.basename(os.path.dirname(path_str))}/", path_str)
+
+            for cache in self._caches:
+                cache.append(name, path_str)
+                parts = name.rsplit(".", 1)
+                if len(parts) == 2:
+                    name = parts[0]
+                else:
+                    break
+
+    def get_matches(self, pattern: str) -> list[str]:
+        key, directory = split_pattern(pattern)
+        # Same directory rules as FileCache.get_matches, but implemented by filtering all files with the key
+        directory_suffix = "/".join([part for part in directory.split("/") if part and part != "."])
+        if directory_suffix:
+            for cache in self._caches:
+                result = [path_str for path_str in cache.get(key)
+                          if (key_directory := get_key_directory(path_str, key)) == directory_suffix
+                          or key_directory.endswith("/" + directory_suffix)]
+                if result:
+                    return result
+
+        for cache in self._caches:
+            if result := cache.get(key):
+                return result
+        return []
+
+
+def generate_paths(file_count: int, seed: int = 0) -> list[str]:
+    rng = random.Random(seed)
+    paths = []
+    for index in range(file_count):
+        depth = rng.randint(0, 5)
+        directories = [f"dir-{rng.randint(0, 30)}" for _ in range(depth)]
+        if rng.random() < 0.1:
+            name = "index.md"
+        else:
+            name = f"file-{index}{rng.choice(EXTENSIONS)}"
+        paths.append("/".join(directories + [name]))
+    return paths
+
+
+def measure(name: str, create) -> object:
+    tracemalloc.start()
+    start_time = time.monotonic()
+    result = create()
+    time_taken = time.monotonic() - start_time
+    current, _peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:<12} {current / 1_000_000:8.1f} MB {time_taken:8.2f} s")
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compares the memory usage of the old and the current FileCache layout")
+    parser.add_argument("file_count", metavar="FILE_COUNT", type=int, nargs="?", default=500_000, help="number of generated paths (default: 500000)")
+    args = parser.parse_args()
+    file_count = args.file_count
+    print(f"Generating {file_count} paths...")
+    paths = generate_paths(file_count)
+
+    # The paths themselves are shared by both layouts, so they are created before measuring
+    old = measure("old layout", lambda: OldLayoutFileCache(paths))
+    new = measure("new layout", lambda: FileCache(Path("/synthetic"), relative_paths=paths))
+
+    # Both layouts need to return the same results
+    rng = random.Random(1)
+    for path in rng.sample(paths, min(10_000, len(paths))):
+        # The full path, a shorter directory suffix, the file name and the name without extensions
+        directories = os.path.dirname(path).split("/")
+        suffix_pattern = "/".join(directories[len(directories) // 2:] + [os.path.basename(path)])
+        for pattern in [path, suffix_pattern, os.path.basename(path), os.path.basename(path).split(".", 1)[0]]:
+            assert old.get_matches(pattern) == new.get_matches(pattern), f"Different results for '{pattern}'"  # type: ignore
+    print("Results of both layouts are identical")
+
+
+if __name__ == "__main__":
+    main()
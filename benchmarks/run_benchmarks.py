@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Runs the benchmarks on synthetic sites (see synthetic_sites.py) and writes the results as JSON.
+If a baseline (the JSON output of a previous run) is given, the results are compared to it
+and the script exits with an error if any benchmark got slower than the allowed threshold.
+
+Usage: python3 benchmarks/run_benchmarks.py [--output results.json] [--baseline baseline.json] [--threshold 0.2] [--skip-build] [generator options]
+"""
+import argparse
+import json
+import logging
+import os
+from pathlib import Path
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable
+# local
+from mkdocs_crosslink_plugin import LOGGER
+from mkdocs_crosslink_plugin.anchor_index import extract_anchors
+from mkdocs_crosslink_plugin.config import CrosslinkPluginConfig, CrosslinkSite
+from mkdocs_crosslink_plugin.file_cache import FileCache
+from mkdocs_crosslink_plugin.replacer import Replacer
+from synthetic_sites import GeneratorOptions, add_generator_arguments, generate_html_page, generate_link_targets, generate_markdown_page, \
+    generate_sites, get_generator_options, write_sites
+
+# Increase this whenever the format of the results changes
+RESULTS_VERSION = 1
+HTML_PAGE_COUNT = 200
+LOOKUP_COUNT = 20_000
+SUGGESTION_COUNT = 1_000
+
+
+def measure(name: str, function: Callable[[], object], operations: int, repeats: int) -> dict:
+    """
+    Runs the function multiple times and returns the fastest run, which is the least affected by other processes
+    """
+    times = []
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start_time)
+    best = min(times)
+    print(f"{name:<28} {best * 1_000:10.2f} ms {operations / best:14,.0f} ops/s")
+    return {"seconds": best, "operations": operations, "repeats": repeats}
+
+
+def create_config() -> CrosslinkPluginConfig:
+    config = CrosslinkPluginConfig()
+    config.load_dict({})
+    config.validate()
+    return config
+
+
+def run_benchmarks(options: GeneratorOptions, repeats: int, skip_build: bool) -> dict:
+    sites = generate_sites(options)
+    rng = random.Random(options.seed + 2)
+    config = create_config()
+    crosslinks = [CrosslinkSite("local" if index == 0 else site.name, Path(f"/synthetic/{site.name}"), f"/{site.name}/", True)
+                  for index, site in enumerate(sites)]
+    results = {}
+
+    def create_caches() -> dict[str, FileCache]:
+        return {crosslink.name: FileCache(crosslink.source_dir, relative_paths=site.paths) for crosslink, site in zip(crosslinks, sites)}
+
+    file_count = sum([len(site.paths) for site in sites])
+    results["file_cache_construction"] = measure("FileCache construction", create_caches, file_count, repeats)
+
+    caches = create_caches()
+    patterns = [(crosslink.name, link.split(":", 1)[1]) for link in generate_link_targets(rng, sites, LOOKUP_COUNT)
+                for crosslink in crosslinks if link.startswith(f"x-{crosslink.name}:")]
+
+    def get_matches() -> None:
+        for name, pattern in patterns:
+            caches[name].get_matches(pattern)
+    results["get_matches"] = measure("FileCache.get_matches", get_matches, len(patterns), repeats)
+
+    # Patterns with a typo (one character removed), so that no file matches them
+    typo_patterns = [(name, pattern[:index] + pattern[index + 1:]) for name, pattern in patterns[:SUGGESTION_COUNT]
+                     for index in [rng.randrange(len(pattern))]]
+    for name in caches:
+        # The index is created on first use, which is not part of this benchmark
+        caches[name].get_suggestions("", 3)
+
+    def get_suggestions() -> None:
+        for name, pattern in typo_patterns:
+            caches[name].get_suggestions(pattern, 3)
+    results["get_suggestions"] = measure("FileCache.get_suggestions", get_suggestions, len(typo_patterns), repeats)
+
+    pages = [generate_html_page(rng, sites, options) for _ in range(HTML_PAGE_COUNT)]
+
+    def handle_pages() -> None:
+        # A new Replacer for every run, so that the resolution cache starts empty
+        replacer = Replacer(crosslinks, config, caches=caches)
+        for index, page in enumerate(pages):
+            replacer.handle_page(f"page{index}.md", page)
+    results["handle_page"] = measure("Replacer.handle_page", handle_pages, len(pages), repeats)
+
+    urls = generate_link_targets(rng, sites, LOOKUP_COUNT)
+
+    def get_protos() -> None:
+        replacer = Replacer(crosslinks, config, caches=caches)
+        for url in urls:
+            replacer.get_proto_for_url("page.md", url)
+    results["get_proto_for_url"] = measure("Replacer.get_proto_for_url", get_protos, len(urls), repeats)
+
+    def resolve_batch() -> None:
+        replacer = Replacer(crosslinks, config, caches=caches)
+        replacer.resolve_batch([url.split("#", 1)[0] for url in urls])
+    results["resolve_batch"] = measure("Replacer.resolve_batch", resolve_batch, len(urls), repeats)
+
+    markdown_pages = [generate_markdown_page(rng, sites, options) for _ in range(HTML_PAGE_COUNT)]
+
+    def get_anchors() -> None:
+        for page in markdown_pages:
+            extract_anchors(page, True)
+    results["extract_anchors"] = measure("extract_anchors", get_anchors, len(markdown_pages), repeats)
+
+    if not skip_build:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            config_file = write_sites(Path(temp_dir), options)
+            site_dir = os.path.join(temp_dir, "output")
+            command = [sys.executable, "-m", "mkdocs", "build", "--quiet", "--config-file", str(config_file), "--site-dir", site_dir]
+            # +1 for the index.md
+            page_count = len([path for path in sites[0].paths if path.endswith(".md")]) + 1
+            results["mkdocs_build"] = measure("mkdocs build", lambda: subprocess.run(command, check=True), page_count, repeats)
+
+    return results
+
+
+def compare_to_baseline(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """
+    Returns the names of the benchmarks that are slower than in the baseline by more than threshold (0.2 -> 20%)
+    """
+    if baseline.get("options") != results["options"]:
+        print("[!] The baseline was created with different generator options, so the results may not be comparable")
+
+    regressions = []
+    for name, result in results["benchmarks"].items():
+        if baseline_result := baseline.get("benchmarks", {}).get(name):
+            ratio = result["seconds"] / baseline_result["seconds"]
+            status = "REGRESSION" if ratio > 1 + threshold else "ok"
+            print(f"{name:<28} {baseline_result['seconds'] * 1_000:10.2f} ms -> {result['seconds'] * 1_000:10.2f} ms ({ratio:0.2f}x) {status}")
+            if ratio > 1 + threshold:
+                regressions.append(name)
+        else:
+            print(f"{name:<28} not in baseline")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Runs the benchmarks on synthetic sites")
+    parser.add_argument("--output", type=Path, help="write the results as JSON to this file")
+    parser.add_argument("--baseline", type=Path, help="compare the results to this file (created with --output)")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown compared to the baseline (default: 0.2 -> 20%%)")
+    parser.add_argument("--repeats", type=int, default=3, help="number of runs per benchmark, the fastest one is used")
+    parser.add_argument("--skip-build", action="store_true", help="do not run the (slow) 'mkdocs build' benchmark")
+    add_generator_arguments(parser)
+    args = parser.parse_args()
+    # The synthetic sites contain ambiguous links on purpose, so the warnings would only slow down the benchmarks
+    LOGGER.setLevel(logging.ERROR)
+
+    options = get_generator_options(args)
+    results = {
+        "version": RESULTS_VERSION,
+        "options": options._asdict(),
+        "python": sys.version.split()[0],
+        "benchmarks": run_benchmarks(options, args.repeats, args.skip_build),
+    }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+        print(f"Wrote results to '{args.output}'")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if regressions := compare_to_baseline(results, baseline, args.threshold):
+            print(f"[!] Slower than the baseline: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
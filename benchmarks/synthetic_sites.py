@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Generates synthetic crosslinked sites for the benchmarks.
+The file lists and pages can be created in memory (for benchmarking FileCache and Replacer directly)
+or written to disk together with a mkdocs.yml (for benchmarking a full 'mkdocs build').
+
+Usage: python3 benchmarks/synthetic_sites.py OUTPUT_DIR [--sites N] [--files N] [--depth N] [--collision-rate R] [--links N] [--page-size N]
+"""
+import argparse
+import os
+from pathlib import Path
+import random
+from typing import NamedTuple
+
+PAGE_EXTENSION = ".md"
+ASSET_EXTENSIONS = [".png", ".min.js", ".css", ".pdf"]
+# Share of the files that are Markdown pages, the rest are assets
+PAGE_RATIO = 0.7
+FILLER_WORDS = ["lorem", "ipsum", "dolor", "sit", "amet", "consectetur", "adipiscing", "elit", "sed", "do", "eiusmod", "tempor"]
+
+
+class GeneratorOptions(NamedTuple):
+    # Number of sites. The first one links to all of them (including itself, via 'local')
+    sites: int = 4
+    # Number of files per site
+    files: int = 2_000
+    # Maximum directory depth of a file
+    depth: int = 4
+    # Probability that a file reuses the name of an existing file (in another directory), which causes ambiguities
+    collision_rate: float = 0.05
+    # Number of crosslinks on each page
+    links: int = 20
+    # Approximate size of each page in bytes (filler text is added until it is reached)
+    page_size: int = 5_000
+    seed: int = 0
+
+
+class SyntheticSite(NamedTuple):
+    name: str
+    # Relative paths with Unix separators
+    paths: list[str]
+
+
+def get_site_name(index: int) -> str:
+    return f"site{index}"
+
+
+def generate_paths(rng: random.Random, options: GeneratorOptions) -> list[str]:
+    paths: list[str] = []
+    names: list[str] = []
+    directories = [f"dir{index}" for index in range(max(options.files // 50, 1))]
+    for index in range(options.files):
+        depth = rng.randint(0, options.depth)
+        parts = [rng.choice(directories) for _ in range(depth)]
+        if names and rng.random() < options.collision_rate:
+            name = rng.choice(names)
+        else:
+            extension = PAGE_EXTENSION if rng.random() < PAGE_RATIO else rng.choice(ASSET_EXTENSIONS)
+            name = f"file{index}{extension}"
+            names.append(name)
+        paths.append("/".join(parts + [name]))
+    # The same path may have been generated twice, which can not exist on disk
+    return list(dict.fromkeys(paths))
+
+
+def generate_sites(options: GeneratorOptions) -> list[SyntheticSite]:
+    rng = random.Random(options.seed)
+    return [SyntheticSite(get_site_name(index), generate_paths(rng, options)) for index in range(options.sites)]
+
+
+def generate_link_targets(rng: random.Random, sites: list[SyntheticSite], count: int, prefix: str = "x-") -> list[str]:
+    """
+    Returns crosslinks to random files of random sites. They use the different ways to reference a file: by name, without extension and with parent directories
+    """
+    links = []
+    for _ in range(count):
+        site_index = rng.randrange(len(sites))
+        site = sites[site_index]
+        path = rng.choice(site.paths)
+        style = rng.randrange(3)
+        if style == 0:
+            pattern = os.path.basename(path)
+        elif style == 1:
+            pattern = os.path.basename(path).split(".", 1)[0]
+        else:
+            pattern = path
+        name = "local" if site_index == 0 else site.name
+        links.append(f"{prefix}{name}:{pattern}")
+    return links
+
+
+def generate_filler(rng: random.Random, size: int) -> str:
+    words = []
+    length = 0
+    while length < size:
+        word = rng.choice(FILLER_WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words)
+
+
+def generate_markdown_page(rng: random.Random, sites: list[SyntheticSite], options: GeneratorOptions) -> str:
+    links = generate_link_targets(rng, sites, options.links)
+    paragraph_size = max(options.page_size // (options.links + 1), 1)
+    parts = ["# Synthetic page\n"]
+    for index, link in enumerate(links):
+        parts.append(generate_filler(rng, paragraph_size))
+        parts.append(f"[Link {index}]({link})\n")
+    parts.append(generate_filler(rng, paragraph_size))
+    return "\n\n".join(parts)
+
+
+def generate_html_page(rng: random.Random, sites: list[SyntheticSite], options: GeneratorOptions) -> str:
+    """
+    Returns a page similar to what MkDocs passes to on_page_content
+    """
+    links = generate_link_targets(rng, sites, options.links)
+    paragraph_size = max(options.page_size // (options.links + 1), 1)
+    parts = ["<h1 id=\"synthetic-page\">Synthetic page</h1>"]
+    for index, link in enumerate(links):
+        parts.append(f"<p>{generate_filler(rng, paragraph_size)} <a href=\"{link}\">Link {index}</a></p>")
+    parts.append(f"<p>{generate_filler(rng, paragraph_size)}</p>")
+    return "\n".join(parts)
+
+
+def write_sites(output_dir: Path, options: GeneratorOptions) -> Path:
+    """
+    Writes the sites to output_dir and returns the path of the mkdocs.yml of the first site, which crosslinks to all others
+    """
+    sites = generate_sites(options)
+    rng = random.Random(options.seed + 1)
+    for site in sites:
+        docs_dir = output_dir / site.name / "docs"
+        for path in site.paths:
+            file_path = docs_dir / path
+            file_path.parent.mkdir(parents=True, exist_ok=True)
+            if path.endswith(PAGE_EXTENSION) and site is sites[0]:
+                # Only the pages of the built site need content
+                file_path.write_text(generate_markdown_page(rng, sites, options))
+            else:
+                file_path.write_text("")
+
+    (output_dir / sites[0].name / "docs" / "index.md").write_text(generate_markdown_page(rng, sites, options))
+
+    crosslinks = "".join([f"""
+    - name: {site.name}
+      source_dir: {(output_dir / site.name / "docs").resolve()}
+      target_url: /{site.name}/
+      use_directory_urls: True""" for site in sites[1:]])
+    config_file = output_dir / sites[0].name / "mkdocs.yml"
+    config_file.write_text(f"""site_name: Synthetic benchmark site
+theme: mkdocs
+# Otherwise the navigation with all pages is rendered on every page, which takes much longer than the plugin
+nav:
+- index.md
+plugins:
+- crosslink:
+    crosslinks:{crosslinks or " []"}
+""")
+    return config_file
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Generates synthetic crosslinked MkDocs sites")
+    parser.add_argument("output_dir", type=Path)
+    add_generator_arguments(parser)
+    args = parser.parse_args()
+    config_file = write_sites(args.output_dir, get_generator_options(args))
+    print(f"Wrote sites to '{args.output_dir}'. Build them with: python3 -m mkdocs build -f {config_file}")
+
+
+def add_generator_arguments(parser: argparse.ArgumentParser) -> None:
+    defaults = GeneratorOptions()
+    parser.add_argument("--sites", type=int, default=defaults.sites, help="number of sites")
+    parser.add_argument("--files", type=int, default=defaults.files, help="number of files per site")
+    parser.add_argument("--depth", type=int, default=defaults.depth, help="maximum directory depth")
+    parser.add_argument("--collision-rate", type=float, default=defaults.collision_rate, help="probability that a file name is reused")
+    parser.add_argument("--links", type=int, default=defaults.links, help="number of crosslinks per page")
+    parser.add_argument("--page-size", type=int, default=defaults.page_size, help="approximate size of each page in bytes")
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+
+
+def get_generator_options(args: argparse.Namespace) -> GeneratorOptions:
+    return GeneratorOptions(sites=args.sites, files=args.files, depth=args.depth, collision_rate=args.collision_rate,
+                            links=args.links, page_size=args.page_size, seed=args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,14 +3,28 @@ import logging
 # Set up a logger for my code to use
 LOGGER = logging.getLogger("mkdocs.plugins.crosslink")
 
-def debug(message: str) -> None:
-    LOGGER.debug(f"[crosslink] {message}")
+# The args are inserted into the message with '%' (like in the logging module), but only if the message is actually shown.
+# So in code that runs for every link, pass expensive values as args instead of formatting them with an f-string
+def debug(message: str, *args: object) -> None:
+    if LOGGER.isEnabledFor(logging.DEBUG):
+        LOGGER.debug("[crosslink] " + message, *args)
 
-def warning(message: str) -> None:
-    LOGGER.warning(f"[crosslink] {message}")
+def warning(message: str, *args: object) -> None:
+    LOGGER.warning("[crosslink] " + message, *args)
 
-def info(message: str) -> None:
-    LOGGER.info(f"[crosslink] {message}")
+def info(message: str, *args: object) -> None:
+    LOGGER.info("[crosslink] " + message, *args)
+
+class WarningCollector(logging.Handler):
+    """
+    Remembers the (already formatted) warnings logged while it is added to LOGGER, so that they can be logged again later
+    """
+    def __init__(self) -> None:
+        super().__init__(logging.WARNING)
+        self.messages: list[str] = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.messages.append(record.getMessage())
 
 # Import local files in the correct order
 # from .utils import replace_regex_matches
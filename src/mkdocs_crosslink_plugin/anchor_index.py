@@ -0,0 +1,203 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+import html
+import json
+import os
+from pathlib import Path
+import re
+from typing import Iterable, NamedTuple, Optional
+# pip dependencies
+from markdown.extensions.toc import slugify, unique
+# local
+from . import debug, warning
+
+# Increase this whenever the format of the file or the extracted anchors change
+ANCHOR_INDEX_VERSION = 1
+ANCHOR_INDEX_FILE_NAME = "anchors.json"
+# Only these files are parsed. Fragments of other files (like '#page=2' of a PDF) are not validated
+MARKDOWN_EXTENSIONS = (".md", ".markdown")
+HTML_EXTENSIONS = (".html", ".htm")
+
+# YAML front matter at the start of a Markdown file
+FRONT_MATTER_REGEX = re.compile(r"\A---[ \t]*\n.*?^(?:---|\.\.\.)[ \t]*$", re.MULTILINE | re.DOTALL)
+# Fenced code block: ```...``` or ~~~...~~~. Lines starting with '#' in them are not headings
+FENCED_CODE_REGEX = re.compile(r"^[ \t]*(?P<fence_chars>`{3,}|~{3,}).*?^[ \t]*(?P=fence_chars)[ \t]*$", re.MULTILINE | re.DOTALL)
+# ATX heading ('## Title') or setext heading (the first line of a block followed by '===' or '---').
+# Blank lines in front of '---' are matched too (and skipped by extract_anchors), since excluding them in the regex makes it backtrack on every long line
+HEADING_REGEX = re.compile(r"^[ ]{0,3}#{1,6}[ \t]+(?P<atx>.*?)(?:[ \t]+#+)?[ \t]*$|^(?<!\S\n)(?P<setext>[^\n]+)\n[ ]{0,3}(?:=+|-+)[ \t]*$", re.MULTILINE)
+# Attribute list at the end of a heading (like '{#custom-id}' or '{: #custom-id .class }'), see the attr_list extension
+ATTRIBUTE_LIST_REGEX = re.compile(r"[ \t]*\{:?([^}\n]*)\}[ \t]*$")
+ATTRIBUTE_LIST_ID_REGEX = re.compile(r"(?:^|\s)#([^\s}]+)")
+# Id in the attribute list of any element
+ATTRIBUTE_LIST_ANY_ID_REGEX = re.compile(r"\{:?[^}\n]*?(?<![^\s{:])#([^\s}]+)[^}\n]*\}")
+# Quoted attribute value in raw HTML. It starts with '=', which allows the regex engine to skip quickly to the next candidate
+HTML_ATTRIBUTE_VALUE_REGEX = re.compile(r"""=\s*(?:"([^"]*)"|'([^']*)')""")
+# The name of an attribute containing an explicit id (or the name of an anchor) directly in front of the '='
+ID_ATTRIBUTE_REGEX = re.compile(r"(?<![\w:-])(?:id|name)\s*$", re.IGNORECASE)
+# Parts of the heading text that are not part of the rendered text: link targets ('(url)' or '[reference]'), emphasis and HTML tags.
+# Other formatting characters (like '*' and '`') are removed by slugify
+LINK_TARGET_REGEX = re.compile(r"\]\([^)]*\)|\]\[[^\]]*\]")
+EMPHASIS_UNDERSCORE_REGEX = re.compile(r"(?<!\w)_+|_+(?!\w)")
+HTML_TAG_REGEX = re.compile(r"<[^>]*>")
+
+
+class AnchorLink(NamedTuple):
+    # The page containing the link
+    page: str
+    # The link as it was written (unquoted)
+    url: str
+    crosslink_name: str
+    # Path of the linked file relative to the crosslink's source_dir
+    target_path: str
+    # The part after the '#'
+    fragment: str
+
+
+class AnchorIndexEntry(NamedTuple):
+    mtime_ns: int
+    size: int
+    anchors: list[str]
+
+
+def can_have_anchors(path: str) -> bool:
+    return path.lower().endswith(MARKDOWN_EXTENSIONS + HTML_EXTENSIONS)
+
+
+def extract_anchors(text: str, is_markdown: bool) -> list[str]:
+    """
+    Returns the explicit ids in a file and the ids of its headings (as created by Python Markdown's toc extension with its default slugify)
+    """
+    # Only the last few characters in front of the '=' can contain the attribute name
+    anchors = [match.group(1) if match.group(1) is not None else match.group(2) for match in HTML_ATTRIBUTE_VALUE_REGEX.finditer(text)
+               if ID_ATTRIBUTE_REGEX.search(text, max(match.start() - 20, 0), match.start())]
+    if not is_markdown:
+        return anchors
+
+    text = FENCED_CODE_REGEX.sub("", FRONT_MATTER_REGEX.sub("", text, count=1))
+    anchors += [match.group(1) for match in ATTRIBUTE_LIST_ANY_ID_REGEX.finditer(text)]
+    # Like in the toc extension, the explicit ids are reserved before the ids of the headings are created
+    used_ids = set(anchors)
+    for match in HEADING_REGEX.finditer(text):
+        title = match.group("atx") if match.group("atx") is not None else match.group("setext")
+        if match.group("setext") is not None and title.isspace():
+            continue
+        if attribute_list := ATTRIBUTE_LIST_REGEX.search(title):
+            if ATTRIBUTE_LIST_ID_REGEX.search(attribute_list.group(1)):
+                continue
+            title = title[:attribute_list.start()]
+        title = html.unescape(HTML_TAG_REGEX.sub("", EMPHASIS_UNDERSCORE_REGEX.sub("", LINK_TARGET_REGEX.sub("]", title))))
+        # Headings with the same title get the suffixes '_1', '_2', ... (unique adds the id to used_ids)
+        anchors.append(unique(slugify(title, "-"), used_ids))
+    return anchors
+
+
+def read_anchors(path: str) -> list[str]:
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        return extract_anchors(f.read(), path.lower().endswith(MARKDOWN_EXTENSIONS))
+
+
+class AnchorIndex:
+    """
+    The anchors of the files that are linked with a fragment. Files are only parsed again, if their modification time or size changed.
+    It can be stored on disk, so that the next build does not need to parse the files again
+    """
+    def __init__(self) -> None:
+        # Absolute path -> entry
+        self.entries: dict[str, AnchorIndexEntry] = {}
+        # Paths requested in the current build. Only these are saved (and kept by the next build),
+        # so that files that are no longer linked are removed eventually
+        self.used_paths: set[str] = set()
+        # Whether start_build was called before, so that the entries of the previous build can be pruned
+        self.started = False
+        self.modified = False
+        self.hits = 0
+        self.parsed = 0
+
+    def start_build(self) -> None:
+        """
+        Must be called at the start of every build (also if the index is not saved), so that used_paths and the counters only cover one build
+        """
+        if self.started:
+            self.entries = {path: entry for path, entry in self.entries.items() if path in self.used_paths}
+        self.started = True
+        self.used_paths = set()
+        self.hits = 0
+        self.parsed = 0
+
+    def get_anchors(self, paths: Iterable[str], worker_count: Optional[int]) -> dict[str, Optional[set[str]]]:
+        """
+        Returns the anchors of each file (None if it can not be read). Files that are not in the index are parsed in a thread pool.
+        worker_count None lets Python choose the number of threads, 1 disables multithreading
+        """
+        result: dict[str, Optional[set[str]]] = {}
+        missing = []
+        for path in dict.fromkeys(paths):
+            self.used_paths.add(path)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                result[path] = None
+                continue
+            entry = self.entries.get(path)
+            if entry and entry.mtime_ns == stat.st_mtime_ns and entry.size == stat.st_size:
+                result[path] = set(entry.anchors)
+                self.hits += 1
+            else:
+                missing.append((path, stat))
+
+        with ThreadPoolExecutor(worker_count) if worker_count != 1 and len(missing) > 1 else nullcontext() as executor:
+            futures = [executor.submit(read_anchors, path) if executor else None for path, _ in missing]
+            for (path, stat), future in zip(missing, futures):
+                try:
+                    anchors = future.result() if future else read_anchors(path)
+                except OSError as ex:
+                    debug("Can not read anchors of '%s': %s", path, ex)
+                    result[path] = None
+                    continue
+                # The stat from before reading is stored, so that a change during reading is detected by the next build
+                self.entries[path] = AnchorIndexEntry(stat.st_mtime_ns, stat.st_size, anchors)
+                self.modified = True
+                self.parsed += 1
+                result[path] = set(anchors)
+        return result
+
+    def get_stats(self) -> dict[str, int]:
+        return {"files from the index": self.hits, "files parsed": self.parsed}
+
+    def to_json(self) -> dict:
+        return {
+            "version": ANCHOR_INDEX_VERSION,
+            "files": {path: list(entry) for path, entry in sorted(self.entries.items()) if path in self.used_paths},
+        }
+
+    def load(self, path: Path) -> None:
+        """
+        Adds the entries stored in the file (written by save). Files with a different version are ignored
+        """
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as ex:
+            warning(f"Ignoring invalid anchor index '{path}': {ex}")
+            return
+
+        if data.get("version") != ANCHOR_INDEX_VERSION:
+            debug("Ignoring anchor index '%s' with version %s", path, data.get("version"))
+            return
+        for file_path, entry in data["files"].items():
+            self.entries[file_path] = AnchorIndexEntry(*entry)
+        debug("Loaded the anchors of %d file(s) from '%s'", len(self.entries), path)
+
+    def save(self, path: Path) -> None:
+        # Removing unused entries also changes the file
+        if not self.modified and self.used_paths == set(self.entries):
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file first, so that an interrupted build can not leave a broken file behind
+        temp_path = path.with_name(path.name + f".{os.getpid()}.tmp")
+        with open(temp_path, "w") as f:
+            json.dump(self.to_json(), f, separators=(",", ":"))
+        os.replace(temp_path, path)
+        self.modified = False
@@ -0,0 +1,105 @@
+import cProfile
+from functools import wraps
+import os
+from pathlib import Path
+import pstats
+import tracemalloc
+from typing import Optional
+# local
+from . import info
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+PSTATS_FILE_NAME = "crosslink.pstats"
+MEMORY_SNAPSHOT_FILE_NAME = "crosslink-memory.snapshot"
+# Number of stack frames stored by tracemalloc for each allocation
+TRACEMALLOC_FRAMES = 10
+
+
+class HookCapture:
+    """
+    Runs the decorated plugin hooks with cProfile (and optionally tracemalloc), if the plugin's 'profiling_capture_dir' is set.
+    The results of all hooks of a build are combined and written to the directory by finish().
+    """
+    def __init__(self) -> None:
+        self.profile: Optional[cProfile.Profile] = None
+        # Whether tracemalloc was started by us (so that we do not stop it, if somebody else uses it)
+        self.started_tracemalloc = False
+
+    def capture(self, f):
+        @wraps(f)
+        def wrap(plugin, *args, **kw):
+            if not plugin.config.profiling_capture_dir:
+                # Disabled: only the check above is added to each call
+                return f(plugin, *args, **kw)
+
+            if self.profile is None:
+                self.profile = cProfile.Profile()
+                if plugin.config.profiling_trace_memory and not tracemalloc.is_tracing():
+                    # Allocations can not be traced per call, so memory is traced from the first hook until the end of the build
+                    tracemalloc.start(TRACEMALLOC_FRAMES)
+                    self.started_tracemalloc = True
+
+            self.profile.enable()
+            try:
+                return f(plugin, *args, **kw)
+            finally:
+                self.profile.disable()
+        return wrap
+
+    def reset(self) -> None:
+        """
+        Discards the collected data without writing it, for example if the build failed before finish() was called.
+        Otherwise cProfile's data and tracemalloc would be carried over into the next build of 'mkdocs serve'
+        """
+        if self.started_tracemalloc:
+            tracemalloc.stop()
+            self.started_tracemalloc = False
+        self.profile = None
+
+    def finish(self, output_dir: Path, top_count: int = 10) -> None:
+        """
+        Writes the collected data to output_dir, logs a short summary and resets everything for the next build
+        """
+        if self.profile is None:
+            return
+
+        # Take the memory snapshot first, so that it does not contain the data created for the summary
+        snapshot, peak = None, 0
+        if self.started_tracemalloc:
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self.started_tracemalloc = False
+
+        output_dir.mkdir(parents=True, exist_ok=True)
+        pstats_path = output_dir / PSTATS_FILE_NAME
+        self.profile.dump_stats(pstats_path)
+        # Stats.stats is not in the type stubs. Stats.get_stats_profile would be, but it rounds the times to milliseconds
+        function_stats = pstats.Stats(self.profile).stats  # type: ignore[attr-defined]
+        self.profile = None
+        lines = []
+        # The functions that took the most time themselves (without the functions they called)
+        for (file_name, line, function_name), (_, call_count, own_time, cumulative_time, _) in sorted(
+                function_stats.items(), key=lambda x: x[1][2], reverse=True)[:top_count]:
+            lines.append(f"{own_time * 1_000:0.2f}ms own, {cumulative_time * 1_000:0.2f}ms total, {call_count} call(s): "
+                         f"{function_name} ({short_path(file_name)}:{line})")
+        info(f"(Capture) Wrote '{pstats_path}'. Top functions by own time:\n" + "\n".join(lines))
+
+        if snapshot:
+            snapshot_path = output_dir / MEMORY_SNAPSHOT_FILE_NAME
+            snapshot.dump(str(snapshot_path))
+            # Only show the memory still used by this plugin (like the file caches)
+            own_snapshot = snapshot.filter_traces([tracemalloc.Filter(True, os.path.join(PACKAGE_DIR, "*"))])
+            statistics = own_snapshot.statistics("lineno")
+            total_size = sum([statistic.size for statistic in statistics])
+            lines = [f"{statistic.size / 1_000:0.1f} kB in {statistic.count} block(s): "
+                     f"{short_path(statistic.traceback[0].filename)}:{statistic.traceback[0].lineno}" for statistic in statistics[:top_count]]
+            info(f"(Capture) Wrote '{snapshot_path}'. Peak traced memory: {peak / 1_000_000:0.1f} MB, "
+                 f"still used by this plugin: {total_size / 1_000_000:0.1f} MB. Top allocations:\n" + "\n".join(lines))
+
+
+def short_path(path: str) -> str:
+    # Show files of this plugin relative to the package, everything else (standard library, mkdocs, ...) unchanged
+    if path.startswith(PACKAGE_DIR):
+        return os.path.relpath(path, os.path.dirname(PACKAGE_DIR))
+    return path
@@ -0,0 +1,118 @@
+import argparse
+import json
+import logging
+import sys
+from typing import Optional
+# pip dependencies
+from mkdocs.config import load_config
+# local
+from . import LOGGER, info
+from .link_check import check_project
+from .migrate_links import migrate_project
+from .orchestrator import build_sites
+from .plugin import CrosslinkPlugin
+
+
+def load_plugin(config_file: str) -> tuple[CrosslinkPlugin, str]:
+    """
+    Loads the MkDocs configuration and returns the configured crosslink plugin and the docs_dir. The site is not built
+    """
+    config = load_config(config_file)
+    plugin = config.plugins.get("crosslink")
+    if not isinstance(plugin, CrosslinkPlugin):
+        raise SystemExit(f"The crosslink plugin is not enabled in '{config_file}'")
+    plugin.on_config(config)
+    return plugin, config.docs_dir
+
+
+def run_migrate(args: argparse.Namespace) -> None:
+    plugin, docs_dir = load_plugin(args.config_file)
+    results = migrate_project(plugin, docs_dir, args.paths or [docs_dir], args.dry_run, args.workers or None)
+    changed_files = [result for result in results if result.changed_count]
+    for result in changed_files:
+        if args.dry_run:
+            sys.stdout.write(result.diff)
+        else:
+            info(f"Migrated {result.changed_count} link(s) in {result.file_name}")
+    action = "Would migrate" if args.dry_run else "Migrated"
+    info(f"{action} {sum([result.changed_count for result in changed_files])} link(s) in {len(changed_files)} of {len(results)} file(s)")
+
+
+def run_affected(args: argparse.Namespace) -> None:
+    plugin, _ = load_plugin(args.config_file)
+    if plugin.dependency_graph is None:
+        raise SystemExit("The dependencies of the pages are only known if 'dependency_graph_file' is set and the site was built")
+    for page in plugin.dependency_graph.get_affected_pages(args.crosslink, args.paths):
+        print(page)
+
+
+def run_check(args: argparse.Namespace) -> None:
+    plugin, docs_dir = load_plugin(args.config_file)
+    result = check_project(plugin, docs_dir, args.paths or [docs_dir], args.workers or None, not args.ignore_ambiguities)
+    if args.format == "json":
+        json.dump(result.to_json(), sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    else:
+        for problem in result.problems:
+            print(f"{problem.file_name}:{problem.line}: {problem.kind}: {problem.message}")
+    info(f"Found {result.get_count('error')} error(s) and {result.get_count('ambiguity')} ambiguity(ies)")
+    if result.problems:
+        raise SystemExit(1)
+
+
+def run_build_all(args: argparse.Namespace) -> None:
+    results = build_sites(args.config_files, args.workers or None, args.strict, args.verbose)
+    for result in results:
+        if result.error:
+            info(f"FAILED {result.config_file} ({result.seconds:0.2f} seconds): {result.error}")
+        else:
+            info(f"OK     {result.config_file} ({result.seconds:0.2f} seconds)")
+    failed_count = len([result for result in results if result.error])
+    info(f"Built {len(results) - failed_count} of {len(results)} site(s)")
+    if failed_count:
+        raise SystemExit(1)
+
+
+def main(args: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="mkdocs-crosslink", description="Tools for the MkDocs crosslink plugin, that do not need a full build")
+    parser.add_argument("-f", "--config-file", default="mkdocs.yml", help="the MkDocs configuration file (default: mkdocs.yml)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="show debug messages")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    migrate_parser = subparsers.add_parser("migrate", help="convert links in the Markdown files to crosslinks (x-NAME:path)",
+                                           description="Converts relative links, links to the target_url of a crosslink and ezlinks style links to crosslinks. "
+                                                       "Only links that can be resolved unambiguously are changed.")
+    migrate_parser.add_argument("-n", "--dry-run", action="store_true", help="do not modify any files, print a unified diff of the changes instead")
+    migrate_parser.add_argument("-j", "--workers", type=int, default=0, help="number of processes to use (default: 0 -> one per CPU)")
+    migrate_parser.add_argument("paths", nargs="*", help="only migrate these files or directories (default: the whole docs_dir)")
+    migrate_parser.set_defaults(function=run_migrate)
+
+    affected_parser = subparsers.add_parser("affected", help="list the pages whose links may change if the given files are added, removed or renamed",
+                                            description="Uses the dependency graph written by the last build (see 'dependency_graph_file'). "
+                                                        "For renamed files pass both the old and the new path.")
+    affected_parser.add_argument("crosslink", help="name of the crosslink containing the files")
+    affected_parser.add_argument("paths", nargs="+", help="paths of the files relative to the crosslink's source_dir")
+    affected_parser.set_defaults(function=run_affected)
+
+    check_parser = subparsers.add_parser("check", help="find crosslinks that can not be resolved or are ambiguous, without building the site",
+                                         description="Scans the Markdown files for crosslinks and resolves each unique link once. "
+                                                     "Exits with status 1 if any problems were found.")
+    check_parser.add_argument("-j", "--workers", type=int, default=0, help="number of processes for scanning the files (default: 0 -> one per CPU)")
+    check_parser.add_argument("--format", choices=["text", "json"], default="text", help="output format (default: text)")
+    check_parser.add_argument("--ignore-ambiguities", action="store_true", help="only report links that can not be resolved")
+    check_parser.add_argument("paths", nargs="*", help="only check these files or directories (default: the whole docs_dir)")
+    check_parser.set_defaults(function=run_check)
+
+    build_all_parser = subparsers.add_parser("build-all", help="build multiple sites that crosslink to each other in parallel",
+                                             description="Indexes the docs_dir of every site and the other crosslinked directories once and shares the indexes "
+                                                         "with all builds. Exits with status 1 if any site failed to build. The --config-file option is ignored.")
+    build_all_parser.add_argument("-j", "--workers", type=int, default=0, help="number of sites to build at the same time (default: 0 -> one per CPU)")
+    build_all_parser.add_argument("-s", "--strict", action="store_true", help="fail a site if it logs any warnings (like 'mkdocs build --strict')")
+    build_all_parser.add_argument("config_files", nargs="+", help="the MkDocs configuration files of the sites")
+    build_all_parser.set_defaults(function=run_build_all)
+
+    parsed = parser.parse_args(args)
+    # MkDocs does not set up logging outside of its own commands
+    LOGGER.addHandler(logging.StreamHandler(sys.stderr))
+    LOGGER.setLevel(logging.DEBUG if parsed.verbose else logging.INFO)
+    parsed.function(parsed)
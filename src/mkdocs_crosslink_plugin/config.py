@@ -3,7 +3,7 @@ import json
 import os
 from pathlib import Path
 import re
-from typing import NamedTuple, Any, Callable
+from typing import NamedTuple, Any, Callable, Optional
 from urllib.parse import urlparse
 # pip dependencies
 from mkdocs.config.base import Config
@@ -16,12 +16,23 @@ CROSSLINK_FIELDS = {
     "name",
     "source_dir",
     "target_url",
-    "use_directory_urls"
+    "use_directory_urls",
+    "manifest_file",
+    "mkdocs_config_file",
+    "index_file",
 }
 
 class CrosslinkPluginConfig(Config):
     enabled = Type(bool, default=True)
     show_profiling_results = Type(bool, default=False)
+    # Number of slowest pages to show in the profiling results
+    profiling_top_pages = Type(int, default=10)
+    # Write the profiling results as JSON to this file after each build (for example to track them in CI). Empty string to disable
+    profiling_report_file = Type(str, default="")
+    # Run the plugin's hooks with cProfile and write the results to this directory. Empty string to disable
+    profiling_capture_dir = Type(str, default="")
+    # Also trace memory allocations with tracemalloc (only used if profiling_capture_dir is set). This slows down the build noticeably
+    profiling_trace_memory = Type(bool, default=False)
     # Default pattern: x-NAME://link
     # This makes it look like a custom protocol, so no warnings should be raised
     prefix = Type(str, default="x-")
@@ -29,6 +40,36 @@ class CrosslinkPluginConfig(Config):
     crosslinks = Type(list, default=[])
     # Dangerous, because it modifies source files
     dangerous_migrate_links = Type(bool, default=False)
+    # Directory to store the file indexes in, so that they can be reused by the next build. Empty string to disable
+    cache_dir = Type(str, default="")
+    # Ignore the stored file indexes and create them from scratch
+    rebuild_cache = Type(bool, default=False)
+    # Number of threads used for creating the file indexes. 0 lets Python choose it based on the CPU count, 1 disables multithreading
+    index_workers = Type(int, default=0)
+    # Write a manifest of all files of this site to this file (relative to the site_dir) after the build. Empty string to disable
+    manifest_export_file = Type(str, default="")
+    # Do not rewrite the links in on_page_content, but rewrite the built HTML files in on_post_build using multiple processes
+    parallel_rewrite = Type(bool, default=False)
+    # Number of processes used by parallel_rewrite. 0 uses one per CPU
+    rewrite_workers = Type(int, default=0)
+    # Rewrite the links in the element tree while Markdown is rendered (with a treeprocessor) instead of scanning the HTML in on_page_content.
+    # This also handles attributes like 'srcset' and 'poster'
+    use_treeprocessor = Type(bool, default=False)
+    # Maximum number of resolved URLs to remember. 0 disables the cache
+    resolution_cache_size = Type(int, default=10_000)
+    # Maximum number of similar file names to suggest, when a crosslink can not be resolved. 0 disables the suggestions
+    suggestion_count = Type(int, default=3)
+    # Check that the '#fragment' of crosslinks to Markdown and HTML files matches a heading or id in the target file.
+    # The anchors of the files are stored in cache_dir (if set), so that unchanged files are not parsed again
+    validate_anchors = Type(bool, default=False)
+    # Maximum number of rewritten pages to remember, so that unchanged pages are not scanned again. They are stored in cache_dir (if set). 0 disables the cache
+    page_cache_size = Type(int, default=0)
+    # Record which crosslinks each page uses and store it as JSON in this file (see dependency_graph.py). Empty string to disable
+    dependency_graph_file = Type(str, default="")
+    # Only show the first occurrence of each warning and summarize the repeated ones at the end of the build
+    summarize_warnings = Type(bool, default=True)
+    # Write all warnings with their number of occurrences and the pages they occurred on as JSON to this file after the build. Empty string to disable
+    warnings_report_file = Type(str, default="")
 
 
 class ConfigError(Exception):
@@ -56,9 +97,88 @@ class CrosslinkSite(NamedTuple):
     # yes: test.md -> test/
     # no: test.md -> test.html
     use_directory_urls: bool
+    # Optional file (for example written by your deployment process) that changes whenever files in source_dir are added or removed.
+    # If its hash did not change, the cached index is used without checking the directories
+    manifest_file: Optional[Path] = None
+    # Optional mkdocs.yml of the project in source_dir. If set, MkDocs' file listing of that project is used instead of walking source_dir,
+    # so that files excluded by its 'exclude_docs' setting are not linked to
+    mkdocs_config_file: Optional[Path] = None
+    # Optional manifest written by the build of the target site (see the manifest_export_file option).
+    # If set, the index is loaded from it and source_dir does not need to exist
+    index_file: Optional[Path] = None
     # # In case multiple matching crosslinks are specified (by wildcards, defaults, etc) this will decide which one to use
 
 
+class GlobCrosslink(NamedTuple):
+    """
+    A crosslink definition with a wildcard ('*') in its name, source_dir and target_url.
+    It is only turned into a CrosslinkSite, when a page references a matching name (see find_glob_crosslink)
+    """
+    name: str
+    source_dir: Path
+    target_url: str
+    use_directory_urls: bool
+    manifest_file: Optional[Path] = None
+    mkdocs_config_file: Optional[Path] = None
+    index_file: Optional[Path] = None
+
+    def get_star_value(self, name: str) -> Optional[str]:
+        """
+        Returns the part of the name, that the wildcard stands for, or None if the name does not match
+        """
+        prefix, suffix = self.name.split("*", 1)
+        if len(name) > len(prefix) + len(suffix) and name.startswith(prefix) and name.endswith(suffix):
+            star_value = name[len(prefix):len(name) - len(suffix)]
+            # The wildcard only matches a single directory name
+            if "/" not in star_value and "\\" not in star_value:
+                return star_value
+        return None
+
+    def instantiate(self, star_value: str) -> Optional[CrosslinkSite]:
+        """
+        Returns the crosslink with the wildcard replaced, or None if its directory (or index_file) does not exist
+        """
+        def replace_star(path: Optional[Path]) -> Optional[Path]:
+            return Path(str(path).replace("*", star_value)) if path else None
+
+        source_dir = Path(str(self.source_dir).replace("*", star_value))
+        index_file = replace_star(self.index_file)
+        if not (index_file.is_file() if index_file else source_dir.is_dir()):
+            return None
+        return CrosslinkSite(name=self.name.replace("*", star_value), source_dir=source_dir, target_url=self.target_url.replace("*", star_value),
+                             use_directory_urls=self.use_directory_urls, manifest_file=replace_star(self.manifest_file),
+                             mkdocs_config_file=replace_star(self.mkdocs_config_file), index_file=index_file)
+
+    def expand(self) -> list[CrosslinkSite]:
+        """
+        Returns the crosslinks for all matching directories. This needs to list the parent directory, so only use it if all crosslinks are needed
+        """
+        # Native globs have some problems (other characters like '[', '?', etc) and extracting the value that star replaced is likely non-trivial
+        source_dir_str = str(self.source_dir).replace("\\", "/")
+        prefix_full, suffix_full = source_dir_str.split("*", 1)
+        prefix_dir, prefix_name = os.path.split(prefix_full)
+        suffix_name = suffix_full.split("/", 1)[0]
+        dir_name_regex = re.compile("^" + re.escape(prefix_name) + "(.+)" + re.escape(suffix_name) + "$")
+
+        crosslinks = []
+        for dir in sorted(Path(prefix_dir).iterdir()):
+            if match := dir_name_regex.match(dir.name):
+                if crosslink := self.instantiate(match.group(1)):
+                    crosslinks.append(crosslink)
+        return crosslinks
+
+
+def find_glob_crosslink(name: str, glob_crosslinks: list[GlobCrosslink]) -> Optional[CrosslinkSite]:
+    """
+    Returns the crosslink created by the first glob crosslink that matches the name and whose directory exists
+    """
+    for glob_crosslink in glob_crosslinks:
+        star_value = glob_crosslink.get_star_value(name)
+        if star_value is not None and (crosslink := glob_crosslink.instantiate(star_value)):
+            return crosslink
+    return None
+
+
 def add_problematic_data_to_exceptions(function: Callable) -> Callable:
     @wraps(function)
     def wrap(data: dict, location: str, *args, **kwargs):
@@ -91,70 +211,49 @@ def create_local_crosslink(mkdocs_config: MkDocsConfig) -> CrosslinkSite:
     )
 
 @add_problematic_data_to_exceptions
-def parse_crosslinks_list(data_list: list[Any], location: str, dict_to_modify: dict[str,CrosslinkSite]) -> None:
+def parse_crosslinks_list(data_list: list[Any], location: str, dict_to_modify: dict[str,CrosslinkSite],
+                          glob_list_to_modify: list[GlobCrosslink]) -> None:
     if data_list:
         for index, data in enumerate(data_list):
-            parse_crosslink(data, f"{location}[{index}]", dict_to_modify)
+            parse_crosslink(data, f"{location}[{index}]", dict_to_modify, glob_list_to_modify)
 
 
 @add_problematic_data_to_exceptions
-def parse_crosslink(data: Any, location: str, dict_to_modify: dict[str,CrosslinkSite]) -> None:
+def parse_crosslink(data: Any, location: str, dict_to_modify: dict[str,CrosslinkSite], glob_list_to_modify: list[GlobCrosslink]) -> None:
     if type(data) != dict:
         raise ConfigError(f"Expected a dict, but got a {type(data).__name__}")
     
     assert_no_unknown_fields(data, CROSSLINK_FIELDS)
 
     name = get_string(data, "name")
-    source_dir = get_directory_path(data, "source_dir")
+    index_file_str = get_optional_string(data, "index_file")
+    index_file = Path(index_file_str) if index_file_str else None
+    # With an index file the files of the site are not needed, so source_dir is only used in messages
+    source_dir = index_file.parent if index_file and "source_dir" not in data else get_directory_path(data, "source_dir")
     target_url = get_string(data, "target_url")
     use_directory_urls = get_bool(data, "use_directory_urls")
+    manifest_file_str = get_optional_string(data, "manifest_file")
+    manifest_file = Path(manifest_file_str) if manifest_file_str else None
+    mkdocs_config_file_str = get_optional_string(data, "mkdocs_config_file")
+    mkdocs_config_file = Path(mkdocs_config_file_str) if mkdocs_config_file_str else None
 
     if not (target_url.startswith("https://") or target_url.startswith("http://") or target_url.startswith("/")):
         warning(f"URL '{target_url}' should probably start with 'https://', 'http://', or '/'")
 
     if has_wildcard(str(source_dir)) and has_wildcard(name) and has_wildcard(target_url):
-        handle_glob_crosslink(name, source_dir, target_url, use_directory_urls, dict_to_modify)
+        # Allow globs for people like me, who store all/most projects in the same directory
+        # and do not want to define it manually for each one. Just be sure to use the same
+        # 'use_directory_urls' settings or define the differing ones manually (manually defined crosslinks take precedence).
+        # The directories are only checked when a page uses a matching name, since the parent directory may contain hundreds of projects
+        glob_list_to_modify.append(GlobCrosslink(name=name, source_dir=source_dir, target_url=target_url, use_directory_urls=use_directory_urls,
+                                                 manifest_file=manifest_file, mkdocs_config_file=mkdocs_config_file, index_file=index_file))
     else:
         if name in dict_to_modify:
             old = dict_to_modify[name]
             raise ConfigError(f"A crosslink named '{name}' already exists: source_dir={old.source_dir}, target_url={old.target_url}")
         else:
-            dict_to_modify[name] = CrosslinkSite(name=name, source_dir=source_dir, target_url=target_url, use_directory_urls=use_directory_urls)
-
-
-def handle_glob_crosslink(name: str, source_dir: Path, target_url: str, use_directory_urls: bool, dict_to_modify: dict[str,CrosslinkSite]) -> None:
-    # Allow globs for people like me, who store all/most projects in the same directory
-    # and do not want to define it manually for each one. Just be sure to use the same
-    # 'use_directory_urls' settings or define
-    # Native globs have some problems (other characters like '[', '?', etc) and extracting the value that star replaced is likely non-trivial
-    source_dir_str = str(source_dir).replace("\\", "/")
-    prefix_full, suffix_full = source_dir_str.split("*", 1)
-    prefix_dir, prefix_name = os.path.split(prefix_full)
-    if "/" in suffix_full:
-        suffix_name, suffix_child = suffix_full.split("/")
-    else:
-        suffix_name, suffix_child = suffix_full, ""
-
-    dir_name_regex = re.compile("^" + re.escape(prefix_name) + "(.+)" + re.escape(suffix_name) + "$")
-
-    for dir in Path(prefix_dir).iterdir():
-        match = dir_name_regex.match(dir.name)
-        if match and dir.is_dir():
-            # Seems to match and is a directory, lets also check with suffix_child
-            full_dir = dir.joinpath(suffix_child)
-            if full_dir.exists() and full_dir.is_dir():
-                star_value = match.group(1)
-                new_name = name.replace("*", star_value)
-                new_url = target_url.replace("*", star_value)
-
-                if new_name in dict_to_modify:
-                    # If one already exists just do nothing, it was probably added manually to overwrite this entry
-                    debug(f"glob expansion: Not adding '{new_name}' ({full_dir}), because it already points to {dict_to_modify[new_name].source_dir}")
-                else:
-                    # This crosslink does not yet exist -> add it
-                    debug(f"glob expansion: Adding '{new_name}' ({full_dir})")
-                    dict_to_modify[new_name] = CrosslinkSite(name=new_name, source_dir=full_dir, target_url=new_url,
-                                                             use_directory_urls=use_directory_urls)
+            dict_to_modify[name] = CrosslinkSite(name=name, source_dir=source_dir, target_url=target_url, use_directory_urls=use_directory_urls,
+                                                 manifest_file=manifest_file, mkdocs_config_file=mkdocs_config_file, index_file=index_file)
 
 
 def has_wildcard(string: str) -> bool:
@@ -176,6 +275,14 @@ def get_string(data: dict, name: str) -> str:
         raise ConfigError(f"Field '{name}' should be set and needs to have a non-empty value")
 
 
+def get_optional_string(data: dict, name: str) -> Optional[str]:
+    value = data.get(name, None)
+    if value is None or type(value) == str:
+        return value
+    else:
+        raise ConfigError(f"Field '{name}' should be a string, but has type {type(value).__name__}")
+
+
 def get_bool(data: dict, name: str) -> bool:
     value = data.get(name, None)
     if value == None:
@@ -0,0 +1,102 @@
+import json
+import os
+from pathlib import Path
+from typing import Iterable
+# local
+from . import debug, warning
+from .file_cache import get_cache_keys, normalize_path_str, split_pattern
+
+# Increase this whenever the format of the file changes
+DEPENDENCY_GRAPH_VERSION = 1
+# Keys of changed files are computed with this many extensions removed, which is more than any crosslink uses by default
+MAX_EXTENSION_COUNT = 10
+
+
+class DependencyGraph:
+    """
+    Records which crosslinks each page uses: page -> (crosslink name, pattern) -> URL the link was rewritten to.
+    The pattern is the part of the link after 'x-NAME:' (without the hash).
+    If a URL matches multiple crosslinks, all of them are recorded, since each of them was checked to resolve it.
+    The ones that were not chosen have an empty URL.
+    """
+    def __init__(self) -> None:
+        # Page (src_path) -> (crosslink name, pattern) -> URL
+        self.pages: dict[str, dict[tuple[str, str], str]] = {}
+
+    def start_page(self, page: str) -> None:
+        """
+        Removes the dependencies of a page, that is rewritten again
+        """
+        self.pages[page] = {}
+
+    def add(self, page: str, crosslink_name: str, pattern: str, url: str) -> None:
+        self.pages.setdefault(page, {})[(crosslink_name, pattern)] = url
+
+    def get_page_dependencies(self, page: str) -> list[tuple[str, str, str]]:
+        return [(crosslink_name, pattern, url) for (crosslink_name, pattern), url in self.pages.get(page, {}).items()]
+
+    def set_page_dependencies(self, page: str, dependencies: Iterable[tuple[str, str, str]]) -> None:
+        self.pages[page] = {(crosslink_name, pattern): url for crosslink_name, pattern, url in dependencies}
+
+    def remove_other_pages(self, pages: Iterable[str]) -> None:
+        """
+        Only keeps the given pages, so that pages that were deleted do not stay in the graph forever
+        """
+        keep = set(pages)
+        for page in [page for page in self.pages if page not in keep]:
+            del self.pages[page]
+
+    def get_affected_pages(self, crosslink_name: str, changed_paths: Iterable[str]) -> list[str]:
+        """
+        Returns the pages whose links may change, if the given files (relative to the crosslink's source_dir) are added, removed or renamed.
+        For renamed files both the old and the new path need to be passed
+        """
+        changed_keys = set()
+        for path_str in changed_paths:
+            changed_keys.update([key for _, key in get_cache_keys(normalize_path_str(path_str), MAX_EXTENSION_COUNT)])
+
+        affected_pages = []
+        for page, dependencies in self.pages.items():
+            for name, pattern in dependencies:
+                # Absolute paths are resolved without looking at the files
+                if name == crosslink_name and not os.path.isabs(pattern) and split_pattern(pattern)[0] in changed_keys:
+                    affected_pages.append(page)
+                    break
+        return sorted(affected_pages)
+
+    def to_json(self) -> dict:
+        return {
+            "version": DEPENDENCY_GRAPH_VERSION,
+            "pages": {page: [list(dependency) for dependency in self.get_page_dependencies(page)] for page in sorted(self.pages)},
+        }
+
+    @staticmethod
+    def load(path: Path) -> "DependencyGraph":
+        """
+        Loads the graph written by save. Returns an empty graph if the file does not exist or can not be used
+        """
+        graph = DependencyGraph()
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return graph
+        except Exception as ex:
+            warning(f"Ignoring invalid dependency graph '{path}': {ex}")
+            return graph
+
+        if data.get("version") != DEPENDENCY_GRAPH_VERSION:
+            debug("Ignoring dependency graph '%s' with version %s", path, data.get("version"))
+            return graph
+        for page, dependencies in data["pages"].items():
+            graph.set_page_dependencies(page, [tuple(dependency) for dependency in dependencies])
+        debug("Loaded dependencies of %d page(s) from '%s'", len(graph.pages), path)
+        return graph
+
+    def save(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file first, so that an interrupted build can not leave a broken file behind
+        temp_path = path.with_name(path.name + f".{os.getpid()}.tmp")
+        with open(temp_path, "w") as f:
+            json.dump(self.to_json(), f, separators=(",", ":"))
+        os.replace(temp_path, path)
@@ -0,0 +1,65 @@
+import json
+from pathlib import Path
+from typing import NamedTuple
+# local
+from . import info, warning
+
+# Increase this whenever the format of the JSON report changes
+DIAGNOSTICS_REPORT_VERSION = 1
+# Number of pages shown for each repeated warning
+SAMPLE_PAGE_COUNT = 5
+
+
+class DiagnosticSummary(NamedTuple):
+    message: str
+    # How often the warning occurred (on all pages)
+    occurrence_count: int
+    # Pages it occurred on, in the order they were built
+    pages: list[str]
+
+
+class Diagnostics:
+    """
+    Collects the warnings of the Replacer (like ambiguities), which often occur on many pages for the same link.
+    If summarize is set, each warning is only logged the first time and repeated ones are summarized by log_summary.
+    """
+    def __init__(self, summarize: bool, log: bool = True) -> None:
+        self.summarize = summarize
+        # If not set, the warnings are only recorded (used by the workers of parallel_rewrite, which send them to the main process)
+        self.log = log
+        # All (page, message) pairs in the order they occurred
+        self.occurrences: list[tuple[str, str]] = []
+        # Message -> pages it occurred on (with duplicates)
+        self._pages: dict[str, list[str]] = {}
+
+    def add(self, page: str, message: str) -> None:
+        self.occurrences.append((page, message))
+        pages = self._pages.setdefault(message, [])
+        pages.append(page)
+        if self.log and (len(pages) == 1 or not self.summarize):
+            warning("(%s) %s", page, message)
+
+    def get_summaries(self) -> list[DiagnosticSummary]:
+        return [DiagnosticSummary(message, len(pages), list(dict.fromkeys(pages))) for message, pages in self._pages.items()]
+
+    def log_summary(self) -> None:
+        if not self.summarize:
+            return
+        for summary in self.get_summaries():
+            if summary.occurrence_count > 1:
+                sample = ", ".join(summary.pages[:SAMPLE_PAGE_COUNT])
+                if len(summary.pages) > SAMPLE_PAGE_COUNT:
+                    sample += f" and {len(summary.pages) - SAMPLE_PAGE_COUNT} more"
+                info(f"Warning occurred {summary.occurrence_count} times on {len(summary.pages)} page(s) ({sample}): {summary.message}")
+
+    def to_json(self) -> dict:
+        return {
+            "version": DIAGNOSTICS_REPORT_VERSION,
+            "warnings": [summary._asdict() for summary in self.get_summaries()],
+        }
+
+    def write_report(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(self.to_json(), f, indent=4)
+        info(f"Wrote warnings report to '{path}'")
@@ -1,7 +1,15 @@
+from array import array
+import hashlib
 import json
 from pathlib import Path
 import os
+import posixpath
 import re
+import sys
+from typing import Iterable, Optional, Sequence, Union
+# local
+from .suggestions import SuggestionIndex
+from .walker import walk_files
 
 PATH_SEPARATOR_REGEX = re.compile(r"[/\\]+")
 
@@ -15,70 +23,371 @@ class MultiValueDict:
         else:
             self._data[key] = [value]
 
+    def remove(self, key: str, value: str):
+        values = self._data.get(key)
+        if values and value in values:
+            values.remove(value)
+            if not values:
+                del self._data[key]
+
     def get(self, key: str) -> list[str]:
         return self._data.get(key, [])
     
     def __str__(self) -> str:
         return json.dumps(self._data)
 
+class PostingDict:
+    """
+    Maps keys to the IDs of paths. Most keys belong to a single path, so a single ID is stored directly as an int
+    (the same int object is shared by all levels) and multiple IDs are stored in a compact array.
+    """
+    def __init__(self) -> None:
+        self._data: dict[str,Union[int,"array[int]"]] = {}
+
+    def append(self, key: str, path_id: int):
+        value = self._data.get(key)
+        if value is None:
+            self._data[key] = path_id
+        elif isinstance(value, int):
+            self._data[key] = array("I", [value, path_id])
+        else:
+            value.append(path_id)
+
+    def remove(self, key: str, path_id: int):
+        value = self._data.get(key)
+        if isinstance(value, int):
+            if value == path_id:
+                del self._data[key]
+        elif value is not None and path_id in value:
+            value.remove(path_id)
+            if len(value) == 1:
+                self._data[key] = value[0]
+
+    def get(self, key: str) -> Sequence[int]:
+        value = self._data.get(key)
+        if value is None:
+            return ()
+        elif isinstance(value, int):
+            return (value,)
+        else:
+            return value
+
+    def keys(self) -> Iterable[str]:
+        return self._data.keys()
+
+    def to_json(self, id_map: dict[int, int]) -> dict[str, Union[int, list[int]]]:
+        # The IDs are translated with id_map, since removed paths are not exported
+        data: dict[str, Union[int, list[int]]] = {}
+        for key, value in self._data.items():
+            if isinstance(value, int):
+                data[key] = id_map[value]
+            else:
+                data[key] = [id_map[path_id] for path_id in value]
+        return data
+
+    @staticmethod
+    def from_json(data: dict[str, Union[int, list[int]]]) -> "PostingDict":
+        posting_dict = PostingDict()
+        for key, value in data.items():
+            posting_dict._data[sys.intern(key)] = value if isinstance(value, int) else array("I", value)
+        return posting_dict
+
+
+class DirectoryTrieNode:
+    """
+    A node of the reverse directory index: the children are keyed by the name of the next directory upwards (parent, grandparent, ...)
+    """
+    __slots__ = ("children", "path_ids")
+
+    def __init__(self) -> None:
+        self.children: dict[str, DirectoryTrieNode] = {}
+        # The files, whose key is located directly in the directory described by the path from the root to this node
+        self.path_ids: list[int] = []
+
+    def get_path_ids(self) -> list[int]:
+        """
+        Returns the IDs of the files in this node and all nodes below it (in the order they were added)
+        """
+        path_ids = []
+        nodes = [self]
+        while nodes:
+            node = nodes.pop()
+            path_ids += node.path_ids
+            nodes += node.children.values()
+        return sorted(path_ids)
+
+
 class FileCache:
-    def __init__(self, files_root: Path, max_extension_count: int = 5) -> None:
+    def __init__(self, files_root: Path, max_extension_count: int = 5, relative_paths: Optional[Iterable[str]] = None) -> None:
         # A list of caches: 0 -> full file name, 1 -> without first file extension, 2 -> without second file extension, ...
         # The caches will be searched in that order. Thus for example searching for "jquery" would return "jquery.min.js".
         self.files_root = files_root
-        self._caches = [MultiValueDict() for _ in range(max_extension_count)]
-
-        if not files_root.exists():
-            raise Exception(f"Directory '{files_root}' does not exist")
-        elif not files_root.is_dir():
-            raise Exception(f"'{files_root}' is not a directory")
-
-        for path in files_root.rglob("*"):
-            self._add_file_to_caches(path, files_root)
-
-    def _add_file_to_caches(self, path: Path, files_root: Path):
-        if path.is_file():
-            name = path.name
-            # Relative path with Unix path separators
-            path_str = os.path.relpath(path, files_root)
-            path_str = normalize_path_str(path_str)
-
-            # Also register index files with the name of the directory.
-            # So you could reference /some/path/index.md as 'path/'
-            # Otherwise referencing index files is a real pain, since every one has the same name
-            if name == "index.md" or name == "index.html":
-                dir_name = path.parent.name if path.parent != files_root else ""
-                self._caches[0].append(f"{dir_name}/", path_str)
-
-            # Add file name to caches
-            for cache in self._caches:
-                cache.append(name, path_str)
-                # remove the last extension from the name
-                parts = name.rsplit(".", 1)
-                if len(parts) == 2:
-                    name = parts[0]
-                else:
-                    # There is nothing left to split off -> exit inner look
-                    break
+        # Each path is only stored once in this table. The caches refer to it by its index (ID). Removed paths are replaced with ""
+        self._paths: list[str] = []
+        self._caches = [PostingDict() for _ in range(max_extension_count)]
+        # Is increased whenever files are added or removed after the cache was created, so that results derived from it can be invalidated
+        self.generation = 0
+        # For each level a tree: key -> parent directory -> grandparent directory -> ... (see DirectoryTrieNode).
+        # They are used to resolve patterns containing directories (like 'guide/install.md') and are only created when first needed
+        self._directory_tries: Optional[list[DirectoryTrieNode]] = None
+        # (generation, hash) of the last call to get_fingerprint
+        self._fingerprint: Optional[tuple[int, str]] = None
+        # (generation, index) of all keys, only created when the first suggestions are needed
+        self._suggestion_index: Optional[tuple[int, SuggestionIndex]] = None
+
+        if relative_paths is None:
+            assert_is_directory(files_root)
+            relative_paths = walk_files(files_root)
+
+        for path_str in relative_paths:
+            self._add_file_to_caches(path_str)
+
+    def add_file(self, path_str: str) -> None:
+        """
+        Adds a file (path relative to files_root) to an existing cache, unless it is already in it
+        """
+        if not self.has_file(path_str):
+            self._add_file_to_caches(path_str)
+            self.generation += 1
+
+    def remove_file(self, path_str: str) -> None:
+        """
+        Removes a file (path relative to files_root) from the cache, if it is in it
+        """
+        path_str = normalize_path_str(path_str)
+        path_id = self._get_path_id(path_str)
+        if path_id is not None:
+            for index, key in self._get_cache_keys(path_str):
+                self._caches[index].remove(key, path_id)
+                # Empty nodes are kept, they do not change the results
+                if self._directory_tries is not None and (node := find_directory_trie_node(self._directory_tries[index], path_str, key)):
+                    node.path_ids.remove(path_id)
+            self._paths[path_id] = ""
+            self.generation += 1
+
+    def has_file(self, path_str: str) -> bool:
+        return self._get_path_id(normalize_path_str(path_str)) is not None
+
+    def _get_path_id(self, path_str: str) -> Optional[int]:
+        for path_id in self._caches[0].get(posixpath.basename(path_str)):
+            if self._paths[path_id] == path_str:
+                return path_id
+        return None
+
+    def _add_file_to_caches(self, path_str: str):
+        # Relative path with Unix path separators
+        path_str = normalize_path_str(path_str)
+        path_id = len(self._paths)
+        self._paths.append(path_str)
+        for index, key in self._get_cache_keys(path_str):
+            # Many keys (like 'index.md' or 'index') exist in lots of directories, so they only need to be stored once
+            self._caches[index].append(sys.intern(key), path_id)
+            if self._directory_tries is not None:
+                add_to_directory_trie(self._directory_tries[index], path_str, key, path_id)
+
+    def _create_directory_tries(self) -> list[DirectoryTrieNode]:
+        directory_tries = [DirectoryTrieNode() for _ in self._caches]
+        for path_id, path_str in enumerate(self._paths):
+            if path_str:
+                for index, key in self._get_cache_keys(path_str):
+                    add_to_directory_trie(directory_tries[index], path_str, key, path_id)
+        return directory_tries
+
+    def _get_cache_keys(self, path_str: str) -> list[tuple[int,str]]:
+        return get_cache_keys(path_str, len(self._caches))
 
     def get_matches(self, pattern: str) -> list[str]:
         # Search the caches: first interpret it as a full file name, then as a file name without the last extension, then a filename without the last two extensions, etc
         # So for example "jquery" would match "jquery", "jquery.js", "jquery.min.js", and finally "jquery.min.js.bak" in that order
-        pattern = normalize_path_str(pattern)
-        if pattern.endswith("/"):
-            key = os.path.basename(pattern[:-1]) + "/"
-        else:
-            key = os.path.basename(pattern)
-        
-        for cache in self._caches:
-            if result := cache.get(key):
+        key, directory = split_pattern(pattern)
+
+        # If the pattern contains directories (like 'guide/install.md'), only return files in matching directories
+        directory_parts = get_directory_parts(directory)
+        if directory_parts:
+            if result := self._get_matches_in_directory(key, directory_parts):
                 return result
+            # Nothing matches the directories. To not break existing links, we ignore the directories like older versions did.
+            # The caller can detect this with is_in_directory and warn about it
+
+        for cache in self._caches:
+            if path_ids := cache.get(key):
+                return [self._paths[path_id] for path_id in path_ids]
         
         # No matches found
         return []
     
+    def _get_matches_in_directory(self, key: str, directory_parts: list[str]) -> list[str]:
+        if self._directory_tries is None:
+            self._directory_tries = self._create_directory_tries()
+
+        # Each directory of the pattern (from the right) selects one child, so finding the node only depends on the number of directories.
+        # Everything below it is in a directory ending with the pattern's directories
+        for directory_trie in self._directory_tries:
+            node = directory_trie.children.get(key)
+            for part in reversed(directory_parts):
+                if node is None:
+                    break
+                node = node.children.get(part)
+            if node is not None and (path_ids := node.get_path_ids()):
+                return [self._paths[path_id] for path_id in path_ids]
+        return []
+
+    def get_suggestions(self, pattern: str, max_count: int) -> list[str]:
+        """
+        Returns keys similar to the key of a pattern without matches, the most similar first.
+        The keys of all levels are used, so that a name without extensions (like 'jqeury') is compared to 'jquery' instead of 'jquery.min.js'.
+        Only the most similar key of each file name is suggested (for example not both 'install.md' and 'install')
+        """
+        if self._suggestion_index is None or self._suggestion_index[0] != self.generation:
+            keys = [key for cache in self._caches for key in cache.keys()]
+            self._suggestion_index = (self.generation, SuggestionIndex(keys))
+        suggestions: list[str] = []
+        for key in self._suggestion_index[1].get_suggestions(split_pattern(pattern)[0], max_count * len(self._caches)):
+            if not any(is_same_file_name(key, suggestion) for suggestion in suggestions):
+                suggestions.append(key)
+                if len(suggestions) == max_count:
+                    break
+        return suggestions
+
+    def get_fingerprint(self) -> str:
+        """
+        Returns a hash of all paths in the cache. Unlike the generation it only depends on the files, so it can be compared between builds
+        """
+        if self._fingerprint is None or self._fingerprint[0] != self.generation:
+            paths = sorted([path_str for path_str in self._paths if path_str])
+            self._fingerprint = (self.generation, hashlib.sha256("\n".join(paths).encode()).hexdigest())
+        return self._fingerprint[1]
+
+    def to_json(self) -> dict:
+        """
+        Returns the paths and the keys of each level, so that the cache can be recreated without computing the keys again
+        """
+        id_map: dict[int, int] = {}
+        paths: list[str] = []
+        for path_id, path_str in enumerate(self._paths):
+            if path_str:
+                id_map[path_id] = len(paths)
+                paths.append(path_str)
+        return {"paths": paths, "levels": [cache.to_json(id_map) for cache in self._caches]}
+
+    @staticmethod
+    def from_json(files_root: Path, data: dict) -> "FileCache":
+        file_cache = FileCache(files_root, max_extension_count=len(data["levels"]), relative_paths=[])
+        file_cache._paths = data["paths"]
+        file_cache._caches = [PostingDict.from_json(level) for level in data["levels"]]
+        return file_cache
+
     def __str__(self) -> str:
-        return "<FileCache>" + "".join([f"\t\nLevel {index}: {cache}" for index, cache in enumerate(self._caches)]) + "\n</FileCache>"
+        levels = [json.dumps({key: [self._paths[path_id] for path_id in cache.get(key)] for key in cache.keys()}) for cache in self._caches]
+        return "<FileCache>" + "".join([f"\t\nLevel {index}: {level}" for index, level in enumerate(levels)]) + "\n</FileCache>"
+
+
+def get_cache_keys(path_str: str, level_count: int) -> list[tuple[int,str]]:
+    """
+    Returns the keys (and the index of the cache to store them in) for a normalized path
+    """
+    keys = []
+    name = posixpath.basename(path_str)
+
+    # Also register index files with the name of the directory.
+    # So you could reference /some/path/index.md as 'path/'
+    # Otherwise referencing index files is a real pain, since every one has the same name
+    if name == "index.md" or name == "index.html":
+        dir_name = posixpath.basename(posixpath.dirname(path_str))
+        keys.append((0, f"{dir_name}/"))
+
+    # Add file name to caches
+    for index in range(level_count):
+        keys.append((index, name))
+        # remove the last extension from the name
+        parts = name.rsplit(".", 1)
+        if len(parts) == 2:
+            name = parts[0]
+        else:
+            # There is nothing left to split off -> exit inner look
+            break
+    return keys
+
+
+def is_same_file_name(key_a: str, key_b: str) -> bool:
+    """
+    Checks whether one key is the other one without some of its extensions (like 'jquery' and 'jquery.min.js')
+    """
+    return key_a.startswith(key_b + ".") or key_b.startswith(key_a + ".")
+
+
+def split_pattern(pattern: str) -> tuple[str, str]:
+    """
+    Returns the key that a pattern is looked up with and the directories in front of it
+    """
+    pattern = normalize_path_str(pattern)
+    if pattern.endswith("/"):
+        return os.path.basename(pattern[:-1]) + "/", os.path.dirname(pattern[:-1])
+    else:
+        return os.path.basename(pattern), os.path.dirname(pattern)
+
+
+def get_key_directory(path_str: str, key: str) -> str:
+    """
+    Returns the directory that a key of the file is located in
+    """
+    directory = posixpath.dirname(path_str)
+    # Directory keys ('path/') of index files refer to the directory containing the file, so the key is located in its parent
+    return posixpath.dirname(directory) if key.endswith("/") else directory
+
+
+def get_directory_parts(directory: str) -> list[str]:
+    """
+    Returns the directories of a pattern's directory, without empty parts and '.'
+    """
+    return [part for part in directory.split("/") if part and part != "."]
+
+
+def is_in_directory(path_str: str, pattern: str) -> bool:
+    """
+    Checks whether a match of the pattern is located in the pattern's directories. It is not, if get_matches ignored the directories
+    """
+    key, directory = split_pattern(pattern)
+    directory_suffix = "/".join(get_directory_parts(directory))
+    key_directory = get_key_directory(path_str, key)
+    return not directory_suffix or key_directory == directory_suffix or key_directory.endswith("/" + directory_suffix)
+
+
+def get_directory_trie_parts(path_str: str, key: str) -> list[str]:
+    """
+    Returns the key followed by the directories containing it, starting with the parent directory
+    """
+    directory = get_key_directory(path_str, key)
+    return [key] + (directory.split("/")[::-1] if directory else [])
+
+
+def add_to_directory_trie(directory_trie: DirectoryTrieNode, path_str: str, key: str, path_id: int) -> None:
+    node = directory_trie
+    for part in get_directory_trie_parts(path_str, key):
+        child = node.children.get(part)
+        if child is None:
+            child = node.children[part] = DirectoryTrieNode()
+        node = child
+    node.path_ids.append(path_id)
+
+
+def find_directory_trie_node(directory_trie: DirectoryTrieNode, path_str: str, key: str) -> Optional[DirectoryTrieNode]:
+    """
+    Returns the node of the directory that a key of the file is located in, or None if the file was not added
+    """
+    node: Optional[DirectoryTrieNode] = directory_trie
+    for part in get_directory_trie_parts(path_str, key):
+        if node is None:
+            break
+        node = node.children.get(part)
+    return node
+
+
+def assert_is_directory(files_root: Path) -> None:
+    if not files_root.exists():
+        raise Exception(f"Directory '{files_root}' does not exist")
+    elif not files_root.is_dir():
+        raise Exception(f"'{files_root}' is not a directory")
 
 
 def normalize_path_str(path: str) -> str:
@@ -0,0 +1,159 @@
+import bisect
+from concurrent.futures import ProcessPoolExecutor
+import re
+import sys
+import time
+from typing import NamedTuple, Optional, TYPE_CHECKING
+import urllib.parse
+# local
+from . import debug, info
+from .migrate_links import split_hash
+from .walker import find_markdown_files
+if TYPE_CHECKING:
+    from .plugin import CrosslinkPlugin
+
+# Code in a Markdown file. Links inside of it are not checked, since they are usually examples
+CODE_REGEX = re.compile("|".join([
+    # Fenced code block: ```...``` or ~~~...~~~
+    r"^[ \t]*(?P<fence_chars>`{3,}|~{3,}).*?^[ \t]*(?P=fence_chars)[ \t]*$",
+    # Inline code: `...`
+    r"`[^`\n]+`",
+]), re.MULTILINE | re.DOTALL)
+# Targets of links. Each alternative starts with ']' or '=', which allows the regex engine to skip quickly to the next candidate.
+# The text in front of the reference definitions and attributes is checked separately (see is_link_target)
+TARGET_REGEX = re.compile("|".join([
+    # Target of a link or image: [text](target "optional title") or [text](<target>)
+    r"\]\([ \t]*<?(?P<link_target>[^)\s>]+)",
+    # Reference link definition: [id]: target
+    r"\]:[ \t]*<?(?P<reference_target>[^\s>]+)",
+    # Attribute value in raw HTML, in double quotes, single quotes or without quotes
+    r"""=\s*(?:"(?P<html_double>[^"\n]*)"|'(?P<html_single>[^'\n]*)'|(?P<html_unquoted>[^\s"'=<>`]+))""",
+]))
+TARGET_GROUPS = ("link_target", "reference_target", "html_double", "html_single", "html_unquoted")
+# The start of a line containing a reference link definition, up to the ']' of the id
+REFERENCE_START_REGEX = re.compile(r"[ ]{0,3}\[[^\]\n]+")
+# The name of an attribute containing a link directly in front of the '='
+LINK_ATTRIBUTE_REGEX = re.compile(r"(?<![\w:-])(?:href|src)\s*$", re.IGNORECASE)
+# Number of files sent to a worker at once
+CHUNK_SIZE = 16
+
+
+class LinkReference(NamedTuple):
+    file_name: str
+    # 1-based line number of the link
+    line: int
+    # The unquoted link including the hash (if it has one)
+    url: str
+
+
+class LinkProblem(NamedTuple):
+    file_name: str
+    line: int
+    url: str
+    # 'error' if the link can not be resolved, 'ambiguity' if it works but multiple files or crosslinks match
+    kind: str
+    message: str
+
+
+class LinkCheckResult(NamedTuple):
+    file_count: int
+    link_count: int
+    unique_link_count: int
+    # Sorted by file name and line
+    problems: list[LinkProblem]
+
+    def get_count(self, kind: str) -> int:
+        return len([problem for problem in self.problems if problem.kind == kind])
+
+    def to_json(self) -> dict:
+        return {
+            "files": self.file_count,
+            "links": self.link_count,
+            "unique_links": self.unique_link_count,
+            "errors": self.get_count("error"),
+            "ambiguities": self.get_count("ambiguity"),
+            "problems": [problem._asdict() for problem in self.problems],
+        }
+
+
+def find_crosslinks(file_name: str, markdown: str, prefix: str) -> list[LinkReference]:
+    """
+    Returns the links in the Markdown, that start with the prefix (after unquoting)
+    """
+    code_ranges = find_code_ranges(markdown)
+    references = []
+    line = 1
+    position = 0
+    for match in TARGET_REGEX.finditer(markdown):
+        group = next(group for group in TARGET_GROUPS if match.group(group) is not None)
+        url = urllib.parse.unquote(match.group(group))
+        if url.startswith(prefix) and is_link_target(markdown, match, group) and not is_in_ranges(match.start(), code_ranges):
+            # Lines are counted incrementally, since the matches are found in order
+            line += markdown.count("\n", position, match.start(group))
+            position = match.start(group)
+            references.append(LinkReference(file_name, line, url))
+    return references
+
+
+def is_link_target(markdown: str, match: re.Match, group: str) -> bool:
+    """
+    Checks the text in front of the match, for the alternatives of TARGET_REGEX that need it
+    """
+    if group == "link_target":
+        return True
+    line_start = markdown.rfind("\n", 0, match.start()) + 1
+    if group == "reference_target":
+        return REFERENCE_START_REGEX.fullmatch(markdown, line_start, match.start()) is not None
+    else:
+        # Attributes spanning multiple lines are not supported, which is good enough for the HTML in Markdown files
+        return LINK_ATTRIBUTE_REGEX.search(markdown, line_start, match.start()) is not None
+
+
+def find_code_ranges(markdown: str) -> list[tuple[int, int]]:
+    if "`" not in markdown and "~~~" not in markdown:
+        return []
+    return [match.span() for match in CODE_REGEX.finditer(markdown)]
+
+
+def is_in_ranges(position: int, ranges: list[tuple[int, int]]) -> bool:
+    # The ranges do not overlap and are sorted
+    index = bisect.bisect_right(ranges, (position, sys.maxsize)) - 1
+    return index >= 0 and position < ranges[index][1]
+
+
+def scan_file(path: str, file_name: str, prefix: str) -> list[LinkReference]:
+    with open(path, "r", encoding="utf-8") as f:
+        return find_crosslinks(file_name, f.read(), prefix)
+
+
+def check_project(plugin: "CrosslinkPlugin", docs_dir: str, paths: list[str], worker_count: Optional[int],
+                  include_ambiguities: bool = True) -> LinkCheckResult:
+    """
+    Checks the crosslinks in all Markdown files below the given paths (files or directories in docs_dir) without building the site.
+    The files are scanned in a process pool, then each unique link is resolved once in this process.
+    The plugin needs to be configured already (by on_config)
+    """
+    start_time = time.monotonic()
+    files = find_markdown_files(paths, docs_dir)
+    prefix = plugin.replacer.prefix
+    if worker_count == 1:
+        reference_lists = [scan_file(path, file_name, prefix) for path, file_name in files]
+    else:
+        # Only the links are sent back, so the workers do not need the file caches
+        with ProcessPoolExecutor(worker_count) as executor:
+            reference_lists = list(executor.map(scan_file, [path for path, _ in files], [file_name for _, file_name in files],
+                                                [prefix] * len(files), chunksize=CHUNK_SIZE))
+    references = [reference for reference_list in reference_lists for reference in reference_list]
+    debug("Found %d crosslink(s) in %d file(s) in %0.2f seconds", len(references), len(files), time.monotonic() - start_time)
+
+    resolutions = plugin.replacer.resolve_batch([split_hash(reference.url)[0] for reference in references])
+    problems = []
+    for reference in references:
+        resolution = resolutions[split_hash(reference.url)[0]]
+        if resolution.is_error():
+            problems.append(LinkProblem(*reference, "error", " ".join(resolution.warnings)))
+        elif resolution.warnings and include_ambiguities:
+            problems.append(LinkProblem(*reference, "ambiguity", " ".join(resolution.warnings)))
+
+    info(f"Checked {len(references)} link(s) ({len(resolutions)} unique) in {len(files)} file(s) in {time.monotonic() - start_time:0.2f} seconds")
+    return LinkCheckResult(len(files), len(references), len(resolutions), problems)
@@ -0,0 +1,51 @@
+import json
+import os
+from pathlib import Path
+# local
+from . import debug, info, warning
+from .config import CrosslinkSite
+from .file_cache import FileCache
+
+# Increase this whenever the format of the manifest changes. Manifests with a different version are rejected
+MANIFEST_VERSION = 1
+
+
+def write_manifest(path: Path, file_cache: FileCache, use_directory_urls: bool) -> None:
+    """
+    Writes the index of a site (all paths and the keys of each level), so that other sites can crosslink to it without having its files
+    """
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "use_directory_urls": use_directory_urls,
+        **file_cache.to_json(),
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Write to a temporary file first, so that an interrupted build can not leave a broken manifest behind
+    temp_path = path.with_name(path.name + f".{os.getpid()}.tmp")
+    with open(temp_path, "w") as f:
+        # No whitespace, since the manifest can contain hundreds of thousands of paths
+        json.dump(manifest, f, separators=(",", ":"))
+    os.replace(temp_path, path)
+    info(f"Wrote manifest with {len(manifest['paths'])} file(s) to '{path}'")
+
+
+def create_file_cache_from_manifest(crosslink: CrosslinkSite) -> FileCache:
+    """
+    Loads the index of the crosslink from its index_file (written by write_manifest) instead of listing its source_dir
+    """
+    assert crosslink.index_file
+    try:
+        with open(crosslink.index_file, "rb") as f:
+            manifest = json.load(f)
+    except Exception as ex:
+        raise Exception(f"Can not load manifest '{crosslink.index_file}' of crosslink '{crosslink.name}': {ex}")
+
+    if manifest.get("version") != MANIFEST_VERSION:
+        raise Exception(f"Manifest '{crosslink.index_file}' has version {manifest.get('version')}, but only version {MANIFEST_VERSION} is supported. "
+                        "Rebuild the site that created it with the same version of this plugin")
+    if manifest.get("use_directory_urls") != crosslink.use_directory_urls:
+        warning(f"Crosslink '{crosslink.name}' has use_directory_urls={crosslink.use_directory_urls}, "
+                f"but the site that wrote '{crosslink.index_file}' used use_directory_urls={manifest.get('use_directory_urls')}")
+
+    debug("Loaded %d file(s) for '%s' from manifest '%s'", len(manifest["paths"]), crosslink.name, crosslink.index_file)
+    return FileCache.from_json(crosslink.source_dir, manifest)
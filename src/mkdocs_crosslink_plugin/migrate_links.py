@@ -1,68 +1,261 @@
+from concurrent.futures import ProcessPoolExecutor
+import difflib
+import os
+import posixpath
 import re
-import urllib
+import shutil
+import tempfile
+from typing import NamedTuple, Optional, TYPE_CHECKING
+import urllib.parse
 # local
+from . import debug, info
+from .config import CrosslinkPluginConfig, CrosslinkSite
+from .file_cache import FileCache, normalize_path_str
 from .replacer import Replacer
+from .walker import find_markdown_files
+if TYPE_CHECKING:
+    from .plugin import CrosslinkPlugin
 
-LINK_TEXT_PATTERN = r"\[([^\]]*)\]" # [Some text]
-LINK_TARGET_PATTERN = r"\(([^)]*)\)" # (https://example.com)
-MARKDOWN_LINKS_REGEX = re.compile(LINK_TEXT_PATTERN + LINK_TARGET_PATTERN)
+# Parts of a Markdown file that are found by a single scan. Code is matched first, so that links inside of it are not modified
+MIGRATION_REGEX = re.compile("|".join([
+    # Fenced code block: ```...``` or ~~~...~~~
+    r"(?P<fence>^[ \t]*(?P<fence_chars>`{3,}|~{3,}).*?^[ \t]*(?P=fence_chars)[ \t]*$)",
+    # Inline code: `...`
+    r"(?P<code>`[^`\n]+`)",
+    # ezlinks style wiki link: [[target]], [[target|text]]
+    r"\[\[(?P<wiki_target>[^\]|\n]+)(?:\|(?P<wiki_text>[^\]\n]*))?\]\]",
+    # Normal link or image: [text](target "optional title")
+    r"(?P<link_text>!?\[[^\]\n]*\])\((?P<link_target>[^)\s]+)(?P<link_title>[^)]*)\)",
+    # Reference link definition: [id]: target
+    r"(?P<reference_id>^[ ]{0,3}\[[^\]\n]+\]:[ \t]*)(?P<reference_target>\S+)",
+]), re.MULTILINE | re.DOTALL)
+# URLs with these schemas are never crosslinks
+NON_HTTP_SCHEME_REGEX = re.compile(r"^[a-zA-Z][a-zA-Z0-9+.-]*:")
+# Number of files sent to a worker at once
+CHUNK_SIZE = 16
 
-def patch_source_file_links_inplace(path: str, replacer: Replacer):
-    with open(path) as f:
-        contents = f.read()
 
-    original_contents = contents
+class MigrationResult(NamedTuple):
+    file_name: str
+    # Number of links that were changed
+    changed_count: int
+    # Unified diff of the changes (only created for dry runs)
+    diff: str
 
-    # @TODO
-    matches = MARKDOWN_LINKS_REGEX.findall(contents)
-    for match in matches:
-        print("DEBUG", path, match.group(0))
 
-    search_start_pos = 0
+class LinkMigrator:
+    """
+    Converts links in Markdown files to crosslinks (x-NAME:path), if they point to a file of one of the crosslinks:
+    - absolute URLs starting with the target_url of a crosslink (like 'https://example.com/guide/install/')
+    - relative links to files in the docs_dir (like '../guide/install.md')
+    - ezlinks style links, that only contain a file name (like '[[install]]' or '[Install](install.md)')
+    Only links that can be resolved unambiguously are changed.
+    """
+    def __init__(self, replacer: Replacer, local_name: Optional[str]) -> None:
+        self.replacer = replacer
+        # Absolute URLs can point to any crosslink, so all of them are needed
+        replacer.expand_glob_crosslinks()
+        # Name of the crosslink that points to the docs_dir containing the files to migrate
+        self.local_name = local_name
+        # Longest target URL first, so that the most specific crosslink is used
+        self.target_urls = sorted([(crosslink.target_url, crosslink.name) for crosslink in replacer.crosslinks.values()],
+                                  key=lambda x: len(x[0]), reverse=True)
 
-    # replace / handle all matches
-    while match := MARKDOWN_LINKS_REGEX.search(contents, search_start_pos):
-        file_contents, search_start_pos = handle_potential_occurence(file_name, file_contents, match)
+    def migrate_markdown(self, file_name: str, markdown: str) -> tuple[str, int]:
+        """
+        Returns the updated Markdown and the number of changed links. file_name is the path of the file relative to the docs_dir
+        """
+        segments = []
+        position = 0
+        changed_count = 0
+        for match in MIGRATION_REGEX.finditer(markdown):
+            replacement = self.get_replacement(file_name, match)
+            if replacement is not None:
+                segments.append(markdown[position:match.start()])
+                segments.append(replacement)
+                position = match.end()
+                changed_count += 1
+        segments.append(markdown[position:])
+        return "".join(segments), changed_count
 
-    
-    
-    if contents != original_contents:
-        with open(path, "w") as f:
+    def get_replacement(self, file_name: str, match: re.Match) -> Optional[str]:
+        if match.group("wiki_target"):
+            target = match.group("wiki_target").strip()
+            crosslink = self.get_crosslink_for_name(target)
+            if crosslink:
+                text = match.group("wiki_text") or target.split("#", 1)[0]
+                return f"[{text}]({crosslink})"
+        elif match.group("link_target"):
+            crosslink = self.get_crosslink_for_url(file_name, match.group("link_target"))
+            if crosslink:
+                return f"{match.group('link_text')}({crosslink}{match.group('link_title')})"
+        elif match.group("reference_target"):
+            crosslink = self.get_crosslink_for_url(file_name, match.group("reference_target"))
+            if crosslink:
+                return match.group("reference_id") + crosslink
+        # Code or a link that should not be changed
+        return None
+
+    def get_crosslink_for_name(self, target: str) -> Optional[str]:
+        """
+        Handles ezlinks style links, that only contain the (unique) name of a file, optionally followed by an anchor
+        """
+        name, url_hash = split_hash(target)
+        if not self.local_name or not name or re.search(r"\s", name):
+            return None
+        matches = self.replacer.get_file_cache(self.local_name).get_matches(name)
+        if len(matches) == 1:
+            return self.replacer.full_name[self.local_name] + name + url_hash
+        return None
+
+    def get_crosslink_for_url(self, file_name: str, url_full: str) -> Optional[str]:
+        url, url_hash = split_hash(urllib.parse.unquote(url_full))
+        if not url or self.replacer.get_matching_protos(url):
+            # Only an anchor or already a crosslink
+            return None
+
+        for target_url, name in self.target_urls:
+            if url.startswith(target_url) and (target_url.endswith("/") or url[len(target_url):len(target_url) + 1] in ["", "/"]):
+                path = self.find_file(name, url[len(target_url):].lstrip("/"))
+                if path is not None:
+                    return self.create_crosslink(name, path) + url_hash
+
+        if NON_HTTP_SCHEME_REGEX.match(url) or url.startswith("/") or not self.local_name:
+            return None
+
+        # A relative link to a file in docs_dir
+        relative_path = posixpath.normpath(posixpath.join(posixpath.dirname(normalize_path_str(file_name)), url))
+        if not relative_path.startswith("../"):
+            path = self.find_file(self.local_name, relative_path)
+            if path is not None:
+                return self.create_crosslink(self.local_name, path) + url_hash
+
+        # An ezlinks style link, that only contains the file name
+        if "/" not in url:
+            return self.get_crosslink_for_name(url + url_hash)
+        return None
+
+    def find_file(self, crosslink_name: str, url_path: str) -> Optional[str]:
+        """
+        Returns the path of the file that the URL path (relative to the crosslink's target_url) was created from
+        """
+        cache = self.replacer.get_file_cache(crosslink_name)
+        candidates = [url_path]
+        if url_path == "" or url_path.endswith("/"):
+            candidates += [url_path + "index.md", url_path + "README.md"]
+            if url_path:
+                candidates.append(url_path[:-1] + ".md")
+        elif url_path.endswith(".html"):
+            candidates.append(url_path[:-len(".html")] + ".md")
+        elif "." not in posixpath.basename(url_path):
+            # Directory URL without the trailing slash
+            candidates += [url_path + ".md", url_path + "/index.md", url_path + "/README.md"]
+        for candidate in candidates:
+            if candidate and not candidate.endswith("/") and cache.has_file(candidate):
+                return candidate
+        return None
+
+    def create_crosslink(self, crosslink_name: str, path: str) -> str:
+        """
+        Returns the crosslink with the shortest pattern (file name, then file name with parent directories) that only matches path
+        """
+        cache = self.replacer.get_file_cache(crosslink_name)
+        parts = path.split("/")
+        for index in range(len(parts) - 1, -1, -1):
+            pattern = "/".join(parts[index:])
+            if cache.get_matches(pattern) == [path]:
+                return self.replacer.full_name[crosslink_name] + pattern
+        # Should not happen, but an absolute path always works
+        return self.replacer.full_name[crosslink_name] + "/" + path
+
+    def migrate_file(self, path: str, file_name: str, dry_run: bool = False) -> MigrationResult:
+        """
+        Migrates the links in the file at path. Unless this is a dry run, the file is replaced atomically if it changed
+        """
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            markdown = f.read()
+        new_markdown, changed_count = self.migrate_markdown(file_name, markdown)
+
+        diff = ""
+        if changed_count:
+            if dry_run:
+                diff = "".join(difflib.unified_diff(markdown.splitlines(keepends=True), new_markdown.splitlines(keepends=True),
+                                                    f"a/{file_name}", f"b/{file_name}"))
+            else:
+                write_file_atomic(path, new_markdown)
+        return MigrationResult(file_name, changed_count, diff)
+
+
+def split_hash(url: str) -> tuple[str, str]:
+    parts = url.split("#", 1)
+    return (parts[0], "#" + parts[1]) if len(parts) == 2 else (url, "")
+
+
+def write_file_atomic(path: str, contents: str) -> None:
+    # Write to a temporary file in the same directory first, so that an interrupted migration can not leave a broken file behind
+    file_descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".crosslink-", suffix=".tmp")
+    try:
+        with os.fdopen(file_descriptor, "w", encoding="utf-8", newline="") as f:
             f.write(contents)
+        shutil.copymode(path, temp_path)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def find_local_crosslink(crosslinks: dict[str, CrosslinkSite], docs_dir: str) -> Optional[str]:
+    """
+    Returns the name of the crosslink pointing to docs_dir ('local' if it was not overwritten)
+    """
+    names = sorted([crosslink.name for crosslink in crosslinks.values() if os.path.abspath(crosslink.source_dir) == os.path.abspath(docs_dir)])
+    return "local" if "local" in names else (names[0] if names else None)
+
+
+def patch_source_file_links_inplace(path: str, file_name: str, migrator: LinkMigrator) -> None:
+    result = migrator.migrate_file(path, file_name)
+    if result.changed_count:
+        info(f"Migrated {result.changed_count} link(s) in {file_name}")
+
+
+# Only set in the worker processes (by _init_worker)
+_migrator: Optional[LinkMigrator] = None
+
+
+def _init_worker(crosslinks: list[CrosslinkSite], config_data: dict, caches: dict[str, FileCache], local_name: Optional[str]) -> None:
+    global _migrator
+    config = CrosslinkPluginConfig()
+    config.load_dict(config_data)
+    config.validate()
+    _migrator = LinkMigrator(Replacer(crosslinks, config, caches=caches), local_name)
+
+
+def _migrate_file(task: tuple[str, str, bool]) -> MigrationResult:
+    assert _migrator
+    return _migrator.migrate_file(*task)
+
+
+def migrate_files(migrator: LinkMigrator, tasks: list[tuple[str, str, bool]], worker_count: Optional[int]) -> list[MigrationResult]:
+    """
+    Migrates the files (path, file_name, dry_run) and returns the results in the same order.
+    The file caches of all crosslinks are created once and sent to each worker process
+    """
+    replacer = migrator.replacer
+    if worker_count == 1:
+        return [migrator.migrate_file(*task) for task in tasks]
 
+    replacer.create_file_caches(replacer.crosslinks)
+    initargs = (list(replacer.crosslinks.values()), dict(replacer.config), replacer.caches, migrator.local_name)
+    with ProcessPoolExecutor(worker_count, initializer=_init_worker, initargs=initargs) as executor:
+        return list(executor.map(_migrate_file, tasks, chunksize=CHUNK_SIZE))
 
-def handle_potential_occurence(self, file_name: str, html: str, match: re.Match) -> tuple[str,int]:
-    # Return the updated document and the index to start the next search from
-    start, end = match.span()        
-    url_full = match.group(2) # 0: full match, 1: first capture group, ...
-    # Some plugins like ezlinks enquote certain characters (like the ':' character used as prefix)
-    # So we need to unquote the URL before we try to inspect it
-    url_full = urllib.parse.unquote(url_full)
-
-    if not url_full.startswith(self.prefix):
-        # Quickly bail out if it is definitely not for us
-        return (html, start + 1)
-
-    # If the URL ends with a hash (to jump to a section), we need to remove it and add it back after the URL is updated.
-    parts = url_full.split("#", 1)
-    if len(parts) == 2:
-        url = parts[0]
-        url_hash = "#" + parts[1]
-    else:
-        url = url_full
-        url_hash = ""
-
-    crosslink_name = self.get_proto_for_url(file_name, url)
-    if crosslink_name:
-        new_url = self.resolve_crosslink(file_name, url, crosslink_name)
-        new_url_updated = self.update_file_url_if_needed(new_url, crosslink_name)
-        debug(f"Resolving: {url_full} -> {new_url + url_hash} -> {new_url_updated + url_hash}")
-
-        # update the URL
-        updated_tag = html[start:end].replace(url, new_url_updated)
-        html = html[:start] + updated_tag + html[end:]
-        return (html, start + len(updated_tag))
-    else:
-        # No matches, seems to be a normal link
-        return (html, start + 1)
 
+def migrate_project(plugin: "CrosslinkPlugin", docs_dir: str, paths: list[str], dry_run: bool, worker_count: Optional[int]) -> list[MigrationResult]:
+    """
+    Migrates all Markdown files below the given paths (files or directories in docs_dir) and returns the results sorted by file name.
+    The plugin needs to be configured already (by on_config)
+    """
+    local_name = find_local_crosslink(plugin.crosslinks, docs_dir)
+    tasks = [(path, file_name, dry_run) for path, file_name in find_markdown_files(paths, docs_dir)]
+    debug("Migrating %d file(s) using the crosslink '%s' for docs_dir", len(tasks), local_name)
+    return migrate_files(LinkMigrator(plugin.replacer, local_name), tasks, worker_count)
@@ -0,0 +1,48 @@
+import os
+from pathlib import Path
+# pip dependencies
+from mkdocs.config.defaults import MkDocsConfig
+from mkdocs.structure.files import Files, get_files
+from mkdocs.utils import yaml_load
+# local
+from . import debug
+from .file_cache import normalize_path_str
+
+
+def get_site_file_paths(files: Files, config: MkDocsConfig) -> list[str]:
+    """
+    Returns the paths (relative to docs_dir) of all files MkDocs knows about, without walking the directory again.
+    Files generated by other plugins are included, files of the theme and files excluded with 'exclude_docs' are not.
+    """
+    theme_dirs = {os.path.abspath(theme_dir) for theme_dir in config.theme.dirs}
+    relative_paths = []
+    for file in files:
+        if file.src_dir and os.path.abspath(file.src_dir) in theme_dirs:
+            continue
+        # 'inclusion' only exists since MkDocs 1.5. Drafts are kept, since they are shown by 'mkdocs serve'
+        inclusion = getattr(file, "inclusion", None)
+        if inclusion is not None and not inclusion.is_in_serve():
+            continue
+        relative_paths.append(normalize_path_str(file.src_path))
+    return relative_paths
+
+
+def list_mkdocs_project_files(config_file: Path) -> list[str]:
+    """
+    Returns the paths (relative to its docs_dir) of all files of another MkDocs project, using MkDocs' own file listing.
+    This respects the other project's 'exclude_docs' setting, but files generated by its plugins are not known.
+    """
+    with open(config_file, "rb") as f:
+        data = yaml_load(f) or {}
+    # mkdocs.config.load_config would also load the project's plugins. Since MkDocs reuses plugin objects that define on_startup
+    # (like this one), that would overwrite the configuration of the running plugins. They are not needed for listing the files anyway
+    data["plugins"] = []
+    data.pop("hooks", None)
+    config = MkDocsConfig(config_file_path=str(config_file))
+    config.load_dict(data)
+    errors, _warnings = config.validate()
+    if errors:
+        raise Exception(f"Invalid MkDocs configuration '{config_file}': " + ", ".join(f"{key}: {error}" for key, error in errors))
+
+    debug("Listing files of MkDocs project '%s' (docs_dir: %s)", config_file, config.docs_dir)
+    return get_site_file_paths(get_files(config), config)
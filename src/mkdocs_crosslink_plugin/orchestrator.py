@@ -0,0 +1,191 @@
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+import logging
+import multiprocessing
+from multiprocessing.context import BaseContext
+import os
+from pathlib import Path
+import time
+from typing import Iterator, NamedTuple, Optional
+# pip dependencies
+from mkdocs.commands.build import build
+from mkdocs.config import load_config
+# local
+from . import LOGGER, debug, info, warning
+from .config import CrosslinkPluginConfig, CrosslinkSite, GlobCrosslink, create_local_crosslink, parse_crosslinks_list
+from .file_cache import FileCache
+from .plugin import CrosslinkPlugin
+from . import replacer as replacer_module
+from .replacer import Replacer, get_file_cache_key
+
+
+class SiteResult(NamedTuple):
+    config_file: str
+    # Empty if the site was built successfully
+    error: str
+    seconds: float
+
+
+@contextmanager
+def config_directory(config_file: str) -> Iterator[str]:
+    """
+    Changes the working directory to the one containing the configuration file (like 'cd SITE && mkdocs build'),
+    since relative paths in the crosslinks are resolved from it. Yields the absolute path of the configuration file
+    """
+    config_path = os.path.abspath(config_file)
+    old_directory = os.getcwd()
+    os.chdir(os.path.dirname(config_path))
+    try:
+        yield config_path
+    finally:
+        os.chdir(old_directory)
+
+
+def collect_crosslinks(config_files: list[str]) -> tuple[list[CrosslinkSite], dict[str, str]]:
+    """
+    Returns the crosslinks used by the sites (each file cache only once) and the errors of the configuration files that could not be loaded.
+    Glob crosslinks are only included for the docs_dirs of the given sites, all others are indexed by the builds when they are used.
+    Sites without the crosslink plugin are still built, but do not contribute any crosslinks
+    """
+    crosslinks: dict[tuple[str, str, str], CrosslinkSite] = {}
+    glob_crosslinks: list[GlobCrosslink] = []
+    docs_dirs = set()
+    errors = {}
+    for config_file in config_files:
+        try:
+            with config_directory(config_file) as config_path:
+                config = load_config(config_path)
+                docs_dirs.add(os.path.abspath(config.docs_dir))
+                # MkDocs may reuse the plugin object for the next configuration file, so everything is copied out of it here
+                plugin = config.plugins.get("crosslink")
+                if not isinstance(plugin, CrosslinkPlugin):
+                    debug("(%s) The crosslink plugin is not enabled, no crosslinks to index", config_file)
+                    continue
+                site_crosslinks: dict[str, CrosslinkSite] = {}
+                site_glob_crosslinks: list[GlobCrosslink] = []
+                parse_crosslinks_list(plugin.config.crosslinks, "crosslinks", site_crosslinks, site_glob_crosslinks)
+                site_crosslinks.setdefault("local", create_local_crosslink(config))
+                # The paths are made absolute, since they are relative to the directory of the site
+                for crosslink in site_crosslinks.values():
+                    crosslinks.setdefault(get_file_cache_key(crosslink), absolute_crosslink(crosslink))
+                glob_crosslinks += [glob_crosslink._replace(source_dir=Path(os.path.abspath(glob_crosslink.source_dir)))
+                                    for glob_crosslink in site_glob_crosslinks]
+        except Exception as ex:
+            errors[config_file] = f"Can not load the configuration: {ex}"
+
+    for glob_crosslink in glob_crosslinks:
+        for crosslink in glob_crosslink.expand():
+            if os.path.abspath(crosslink.source_dir) in docs_dirs:
+                crosslinks.setdefault(get_file_cache_key(crosslink), absolute_crosslink(crosslink))
+    return list(crosslinks.values()), errors
+
+
+def absolute_crosslink(crosslink: CrosslinkSite) -> CrosslinkSite:
+    """
+    The orchestrator indexes the crosslinks of all sites from one working directory, so it needs absolute paths.
+    The builds look the caches up by get_file_cache_key and still use the configured paths (for example in warnings)
+    """
+    return crosslink._replace(
+        source_dir=Path(os.path.abspath(crosslink.source_dir)),
+        manifest_file=Path(os.path.abspath(crosslink.manifest_file)) if crosslink.manifest_file else None,
+        mkdocs_config_file=Path(os.path.abspath(crosslink.mkdocs_config_file)) if crosslink.mkdocs_config_file else None,
+        index_file=Path(os.path.abspath(crosslink.index_file)) if crosslink.index_file else None,
+    )
+
+
+def create_shared_file_caches(crosslinks: list[CrosslinkSite]) -> dict[tuple[str, str, str], FileCache]:
+    """
+    Creates the file caches of all crosslinks (in parallel). Crosslinks that can not be indexed are skipped,
+    so that the error is reported by the builds that use them
+    """
+    config = CrosslinkPluginConfig()
+    config.load_dict({})
+    config.validate()
+    # The names only need to be unique, they are not visible to the user
+    named_crosslinks = {str(index): crosslink._replace(name=str(index)) for index, crosslink in enumerate(crosslinks)}
+    replacer = Replacer(list(named_crosslinks.values()), config)
+    try:
+        replacer.create_file_caches(named_crosslinks)
+    except Exception:
+        # Find out which ones fail by indexing them one by one
+        for name, crosslink in named_crosslinks.items():
+            try:
+                replacer.create_file_caches([name])
+            except Exception as ex:
+                debug("Not sharing the index of '%s': %s", crosslink.source_dir, ex)
+    return {get_file_cache_key(named_crosslinks[name]): cache for name, cache in replacer.caches.items()}
+
+
+def _init_worker(caches: dict[tuple[str, str, str], FileCache], verbose: bool) -> None:
+    replacer_module.SHARED_FILE_CACHES = caches
+    # The messages are logged by the handler added in _build_site instead
+    LOGGER.handlers.clear()
+    LOGGER.setLevel(logging.NOTSET)
+    logging.getLogger("mkdocs").setLevel(logging.DEBUG if verbose else logging.WARNING)
+
+
+def _build_site(config_file: str, strict: bool) -> SiteResult:
+    start_time = time.monotonic()
+    # Each message is prefixed with the configuration file, since the sites are built at the same time
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(f"[{config_file}] %(levelname)-7s -  %(message)s"))
+    mkdocs_logger = logging.getLogger("mkdocs")
+    mkdocs_logger.addHandler(handler)
+    try:
+        with config_directory(config_file) as config_path:
+            config = load_config(config_path, strict=strict or None)
+            config.plugins.on_startup(command="build", dirty=False)
+            try:
+                build(config)
+            finally:
+                config.plugins.on_shutdown()
+        return SiteResult(config_file, "", time.monotonic() - start_time)
+    except BaseException as ex:
+        # For example mkdocs.exceptions.Abort (raised for SystemExit), which is used for warnings in strict mode
+        return SiteResult(config_file, f"{type(ex).__name__}: {ex}", time.monotonic() - start_time)
+    finally:
+        mkdocs_logger.removeHandler(handler)
+
+
+def run_builds(config_files: list[str], worker_count: Optional[int], mp_context: Optional[BaseContext], caches: dict[tuple[str, str, str], FileCache],
+               strict: bool, verbose: bool) -> dict[str, SiteResult]:
+    """
+    Builds each site in a separate task, so that an exception (like BrokenProcessPool) only fails the sites it belongs to
+    """
+    results = {}
+    with ProcessPoolExecutor(worker_count, mp_context=mp_context, initializer=_init_worker, initargs=(caches, verbose)) as executor:
+        futures: dict[str, Future[SiteResult]] = {config_file: executor.submit(_build_site, config_file, strict) for config_file in config_files}
+        for config_file, future in futures.items():
+            try:
+                results[config_file] = future.result()
+            except Exception as ex:
+                results[config_file] = SiteResult(config_file, f"{type(ex).__name__}: {ex}", 0)
+    return results
+
+
+def build_sites(config_files: list[str], worker_count: Optional[int], strict: bool = False, verbose: bool = False) -> list[SiteResult]:
+    """
+    Builds the sites in a process pool. The file caches of all crosslinks are created once before and are inherited by the workers,
+    so that every build does not index the other sites again. Returns the results in the same order as config_files
+    """
+    start_time = time.monotonic()
+    crosslinks, errors = collect_crosslinks(config_files)
+    caches = create_shared_file_caches(crosslinks)
+    info(f"Indexed {len(caches)} directories for {len(config_files)} site(s) in {time.monotonic() - start_time:0.2f} seconds")
+
+    valid_config_files = [config_file for config_file in config_files if config_file not in errors]
+    # With 'fork' the workers inherit the caches without having to copy them
+    mp_context = multiprocessing.get_context("fork") if "fork" in multiprocessing.get_all_start_methods() else None
+    results = run_builds(valid_config_files, worker_count, mp_context, caches, strict, verbose)
+    # If a worker crashed, all pending builds fail too. They are built again one by one, so that only the site causing the crash fails
+    broken_config_files = [config_file for config_file, result in results.items() if result.error.startswith(BrokenProcessPool.__name__)]
+    if broken_config_files:
+        warning("A worker process crashed, building %d site(s) again one by one", len(broken_config_files))
+        for config_file in broken_config_files:
+            results.update(run_builds([config_file], 1, mp_context, caches, strict, verbose))
+
+    for config_file, error in errors.items():
+        warning(f"({config_file}) {error}")
+        results[config_file] = SiteResult(config_file, error, 0)
+    return [results[config_file] for config_file in config_files]
@@ -0,0 +1,135 @@
+from collections import OrderedDict
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Callable, NamedTuple, Optional
+# local
+from . import debug, warning
+from .anchor_index import AnchorLink
+from .config import CrosslinkPluginConfig, CrosslinkSite, GlobCrosslink
+
+# Increase this whenever the format of the cache file or the output of the Replacer changes, so that old entries are ignored
+PAGE_CACHE_VERSION = 4
+PAGE_CACHE_FILE_NAME = "pages.json"
+
+
+class PageCacheEntry(NamedTuple):
+    # The page after the crosslinks were rewritten
+    html: str
+    # Crosslink name -> FileCache.get_fingerprint() for every crosslink the page may use (see Replacer.get_used_crosslinks).
+    # If any of them changed, a file was added or removed and the links need to be resolved again.
+    # Names of glob crosslinks that did not exist yet are stored with an empty fingerprint (see Replacer.get_missing_glob_names)
+    fingerprints: dict[str, str]
+    # Warnings of the Replacer (without the page's file name) for this page, so that they can be repeated for cache hits
+    warnings: list[str]
+    # Links with a fragment, that need to be validated again on every build (since the target files may have changed). See Replacer.anchor_links
+    anchor_links: list[AnchorLink]
+
+
+def get_page_key(file_name: str, html: str) -> str:
+    return hashlib.sha256(f"{file_name}\0{html}".encode()).hexdigest()
+
+
+def get_config_hash(crosslinks: dict[str, CrosslinkSite], glob_crosslinks: list[GlobCrosslink], config: CrosslinkPluginConfig) -> str:
+    """
+    Returns a hash of everything (besides the files) that the rewritten pages and their warnings depend on
+    """
+    options = (config.prefix, config.suffix, config.suggestion_count, config.validate_anchors)
+    data = repr((PAGE_CACHE_VERSION, options, sorted(crosslinks.items()), glob_crosslinks))
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+class PageCache:
+    """
+    Least recently used cache mapping the hash of a page (see get_page_key) to the page with rewritten crosslinks.
+    It can be stored on disk, so that unchanged pages are not scanned again by the next build. A size of 0 disables the cache.
+    """
+    def __init__(self, max_size: int, config_hash: str) -> None:
+        self.max_size = max_size
+        self.config_hash = config_hash
+        self._data: OrderedDict[str, PageCacheEntry] = OrderedDict()
+        # Whether the cache changed since it was loaded or saved
+        self.modified = False
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str, get_fingerprint: Callable[[str], str]) -> Optional[PageCacheEntry]:
+        """
+        Returns the entry, if the file caches of all crosslinks it depends on still have the same fingerprint
+        """
+        entry = self._data.get(key)
+        if entry is not None and all(get_fingerprint(name) == fingerprint for name, fingerprint in entry.fingerprints.items()):
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry
+        else:
+            self.misses += 1
+            return None
+
+    def put(self, key: str, entry: PageCacheEntry) -> None:
+        if self.max_size <= 0:
+            return
+
+        self._data[key] = entry
+        self._data.move_to_end(key)
+        self.modified = True
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def update_config_hash(self, config_hash: str) -> None:
+        """
+        Removes all entries if the configuration changed
+        """
+        if config_hash != self.config_hash:
+            self.config_hash = config_hash
+            if self._data:
+                debug("Configuration changed, clearing the page cache")
+                self._data.clear()
+                self.modified = True
+
+    def get_stats(self) -> dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+    def to_json(self) -> dict:
+        return {
+            "version": PAGE_CACHE_VERSION,
+            "config_hash": self.config_hash,
+            # Least recently used first
+            "pages": {key: entry._asdict() for key, entry in self._data.items()},
+        }
+
+    def load(self, path: Path) -> None:
+        """
+        Adds the entries stored in the file (written by save). Files with a different version or configuration are ignored
+        """
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as ex:
+            warning(f"Ignoring invalid cache file '{path}': {ex}")
+            return
+
+        if data.get("version") != PAGE_CACHE_VERSION or data.get("config_hash") != self.config_hash:
+            debug("Ignoring page cache '%s', since it was created with a different configuration", path)
+            return
+        pages = list(data["pages"].items())
+        for key, entry in pages[max(len(pages) - self.max_size, 0):]:
+            entry["anchor_links"] = [AnchorLink(*link) for link in entry["anchor_links"]]
+            self._data[key] = PageCacheEntry(**entry)
+        debug("Loaded %d page(s) from the page cache '%s'", len(self._data), path)
+
+    def save(self, path: Path) -> None:
+        if not self.modified:
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file first, so that an interrupted build can not leave a broken cache file behind
+        temp_path = path.with_name(path.name + f".{os.getpid()}.tmp")
+        with open(temp_path, "w") as f:
+            json.dump(self.to_json(), f, separators=(",", ":"))
+        os.replace(temp_path, path)
+        self.modified = False
@@ -0,0 +1,109 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple, Optional
+# local
+from . import LOGGER, WarningCollector
+from .anchor_index import AnchorLink
+from .config import CrosslinkPluginConfig, CrosslinkSite, GlobCrosslink
+from .dependency_graph import DependencyGraph
+from .diagnostics import Diagnostics
+from .file_cache import FileCache
+from .replacer import Replacer
+
+# Number of files sent to a worker at once. Larger chunks reduce the communication overhead
+CHUNK_SIZE = 16
+
+
+class RewriteTask(NamedTuple):
+    # The name used in log messages, same as in on_page_content
+    src_path: str
+    # The built HTML file to rewrite
+    dest_path: str
+
+
+class RewriteResult(NamedTuple):
+    src_path: str
+    # The warnings logged while rewriting the file (already formatted)
+    warnings: list[str]
+    # How much the Replacer's and resolution cache's counters increased for this file
+    replacer_stats: dict[str, int]
+    resolution_cache_stats: dict[str, int]
+    # See DependencyGraph.get_page_dependencies. Empty if the dependencies are not recorded
+    dependencies: list[tuple[str, str, str]]
+    # The warnings of the Replacer as (page, message), see Diagnostics. Empty if they are logged directly (and are in warnings instead)
+    diagnostics: list[tuple[str, str]]
+    # See Replacer.anchor_links. Empty if anchors are not validated
+    anchor_links: list[AnchorLink]
+
+
+# Only set in the worker processes (by _init_worker)
+_replacer: Optional[Replacer] = None
+_collector: Optional[WarningCollector] = None
+_collect_diagnostics = False
+
+
+def _init_worker(crosslinks: list[CrosslinkSite], config_data: dict, caches: dict[str, FileCache], glob_crosslinks: list[GlobCrosslink],
+                 record_dependencies: bool, collect_diagnostics: bool, collect_anchor_links: bool) -> None:
+    global _replacer, _collector, _collect_diagnostics
+    config = CrosslinkPluginConfig()
+    config.load_dict(config_data)
+    config.validate()
+    _replacer = Replacer(crosslinks, config, caches=caches, glob_crosslinks=glob_crosslinks)
+    if record_dependencies:
+        _replacer.dependency_graph = DependencyGraph()
+    _collect_diagnostics = collect_diagnostics
+    if collect_anchor_links:
+        _replacer.anchor_links = []
+
+    # The warnings are sent to the main process, which logs them in a deterministic order
+    _collector = WarningCollector()
+    LOGGER.addHandler(_collector)
+    LOGGER.propagate = False
+
+
+def _rewrite_file(task: RewriteTask) -> RewriteResult:
+    assert _replacer and _collector
+    _collector.messages = []
+    if _collect_diagnostics:
+        _replacer.diagnostics = Diagnostics(summarize=False, log=False)
+    if _replacer.anchor_links is not None:
+        _replacer.anchor_links = []
+    replacer_stats = _replacer.get_stats()
+    resolution_cache_stats = _replacer.resolution_cache.get_stats()
+
+    with open(task.dest_path, "r", encoding="utf-8", newline="") as f:
+        html = f.read()
+    try:
+        new_html = _replacer.handle_page(task.src_path, html)
+    except Exception as ex:
+        raise Exception(f"Error rewriting '{task.dest_path}': {ex}")
+    if new_html != html:
+        with open(task.dest_path, "w", encoding="utf-8", newline="") as f:
+            f.write(new_html)
+
+    return RewriteResult(
+        task.src_path,
+        _collector.messages,
+        get_increase(replacer_stats, _replacer.get_stats()),
+        get_increase(resolution_cache_stats, _replacer.resolution_cache.get_stats()),
+        _replacer.dependency_graph.get_page_dependencies(task.src_path) if _replacer.dependency_graph else [],
+        _replacer.diagnostics.occurrences if _replacer.diagnostics else [],
+        _replacer.anchor_links or [],
+    )
+
+
+def get_increase(old: dict[str, int], new: dict[str, int]) -> dict[str, int]:
+    return {name: value - old.get(name, 0) for name, value in new.items()}
+
+
+def rewrite_files_parallel(replacer: Replacer, tasks: list[RewriteTask], worker_count: Optional[int]) -> list[RewriteResult]:
+    """
+    Rewrites the crosslinks in the given HTML files using a process pool. The file caches of the replacer are sent to each worker once,
+    so they should already contain all crosslinks that are used. Missing ones are created by each worker on its own.
+    The results are returned in the same order as the tasks.
+    """
+    config_data = dict(replacer.config)
+    crosslinks = list(replacer.crosslinks.values())
+    initargs = (crosslinks, config_data, replacer.caches, replacer.glob_crosslinks, replacer.dependency_graph is not None,
+                replacer.diagnostics is not None, replacer.anchor_links is not None)
+    with ProcessPoolExecutor(worker_count, initializer=_init_worker, initargs=initargs) as executor:
+        return list(executor.map(_rewrite_file, tasks, chunksize=CHUNK_SIZE))
@@ -1,65 +1,334 @@
 import os
+from pathlib import Path
+import time
+from typing import Literal, Optional
 # pip dependency
 import mkdocs
-from mkdocs.plugins import BasePlugin
+from mkdocs.livereload import LiveReloadServer
+from mkdocs.plugins import BasePlugin, event_priority
 from mkdocs.config.defaults import MkDocsConfig
 from mkdocs.structure.pages import Page
 from mkdocs.structure.files import Files
 # local files
-from .config import parse_crosslinks_list, create_local_crosslink, CrosslinkPluginConfig, CrosslinkSite
+from . import LOGGER, info, warning
+from .config import parse_crosslinks_list, create_local_crosslink, find_glob_crosslink, CrosslinkPluginConfig, CrosslinkSite, GlobCrosslink
 from .replacer import Replacer
 from .profiling import Profiler
-from .migrate_links import patch_source_file_links_inplace
+from .capture import HookCapture
+from .migrate_links import LinkMigrator, find_local_crosslink, patch_source_file_links_inplace
+from .watcher import IndexWatcher
+from .mkdocs_files import get_site_file_paths
+from .parallel import RewriteTask, rewrite_files_parallel
+from .manifest import write_manifest
+from .dependency_graph import DependencyGraph
+from .diagnostics import Diagnostics
+from .treeprocessor import CrosslinkExtension
+from .anchor_index import ANCHOR_INDEX_FILE_NAME, AnchorIndex
+from .page_cache import PAGE_CACHE_FILE_NAME, PageCache, PageCacheEntry, get_config_hash, get_page_key
+from .file_cache import FileCache
 
 PROFILER = Profiler()
+CAPTURE = HookCapture()
 
 
 class CrosslinkPlugin(BasePlugin[CrosslinkPluginConfig]):
+    # Created in on_config
+    replacer: Replacer
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.crosslinks: dict[str,CrosslinkSite] = {}
+        self.glob_crosslinks: list[GlobCrosslink] = []
+        self.watcher: Optional[IndexWatcher] = None
+        # Pages that will be rewritten in on_post_build (only used with parallel_rewrite)
+        self.rewrite_tasks: list[RewriteTask] = []
+        self.rewrite_crosslinks: set[str] = set()
+        # All files of this site (set in on_files)
+        self.site_file_paths: list[str] = []
+        # Only created if page_cache_size is set. It is kept between the builds of 'mkdocs serve'
+        self.page_cache: Optional[PageCache] = None
+        # The page that is currently rendered (used by the treeprocessor)
+        self.current_page = ""
+        # Warnings of the Replacer in the current build
+        self.diagnostics = Diagnostics(summarize=True)
+        # Only created if dependency_graph_file is set. It is kept between the builds of 'mkdocs serve'
+        self.dependency_graph: Optional[DependencyGraph] = None
+        # Only created if validate_anchors is set. It is kept between the builds of 'mkdocs serve'
+        self.anchor_index: Optional[AnchorIndex] = None
+        # Only created if dangerous_migrate_links is set. It is shared by all pages of a build
+        self.migrator: Optional[LinkMigrator] = None
+
+    def on_startup(self, *, command: Literal['build', 'gh-deploy', 'serve'], dirty: bool) -> None:
+        """
+        Defining this keeps the plugin object alive between the builds of 'mkdocs serve', so that the file caches can be reused.
+        MkDocs also reuses the object when multiple sites are built in the same process (see 'build-all'), so the state of the previous site is removed here.
+        """
+        self.watcher = IndexWatcher() if command == "serve" else None
+        self.page_cache = None
+        self.dependency_graph = None
+        self.anchor_index = None
+
     @PROFILER.profile
+    @CAPTURE.capture
     def on_config(self, config: MkDocsConfig, **kwargs) -> MkDocsConfig:
         """
         Called once when the config is loaded.
         It will make modify the config and initialize this plugin.
         """
-        self.crosslinks: dict[str,CrosslinkSite] = {}
-        parse_crosslinks_list(self.config.crosslinks, "crosslinks", self.crosslinks)
+        # Each build of 'mkdocs serve' is measured on its own
+        PROFILER.reset()
+        self.crosslinks = {}
+        self.glob_crosslinks = []
+        parse_crosslinks_list(self.config.crosslinks, "crosslinks", self.crosslinks, self.glob_crosslinks)
+
+        if not self.config.cache_dir:
+            # The manifest is only compared to the one stored with the cached index, so without a cache_dir there is nothing to compare it to
+            manifest_names = [site.name for site in self.crosslinks.values() if site.manifest_file]
+            manifest_names += [glob_crosslink.name for glob_crosslink in self.glob_crosslinks if glob_crosslink.manifest_file]
+            for name in manifest_names:
+                warning("The 'manifest_file' of crosslink '%s' is ignored, since 'cache_dir' is not set", name)
 
         # If not already created/overwritten by the user, provide a default value for 'local'
         local_crosslink = create_local_crosslink(config)
         if local_crosslink.name not in self.crosslinks:
             self.crosslinks[local_crosslink.name] = local_crosslink
 
-        self.replacer = Replacer(list(self.crosslinks.values()), self.config) # @TODO: make it work with a dict?
+        # When serving, reuse the caches of the previous build, which were updated based on the file system events
+        reusable_caches = {}
+        old_replacer: Optional[Replacer] = getattr(self, "replacer", None)
+        if self.watcher and old_replacer:
+            # Crosslinks created from globs are only known to the replacer that used them, so they are looked up again
+            new_crosslinks = {name: crosslink for name in old_replacer.caches
+                              if (crosslink := self.crosslinks.get(name) or find_glob_crosslink(name, self.glob_crosslinks))}
+            reusable_caches = self.watcher.update_caches(old_replacer.caches, old_replacer.crosslinks, new_crosslinks)
+
+        self.replacer = Replacer(list(self.crosslinks.values()), self.config, PROFILER, reusable_caches, self.glob_crosslinks) # @TODO: make it work with a dict?
+        # The migrator only looks up the file caches when it is used, so the ones created from MkDocs' files in on_files are used too
+        self.migrator = LinkMigrator(self.replacer, find_local_crosslink(self.crosslinks, config.docs_dir)) if self.config.dangerous_migrate_links else None
+        self.rewrite_tasks = []
+        self.rewrite_crosslinks = set()
+
+        config_hash = get_config_hash(self.crosslinks, self.glob_crosslinks, self.config)
+        if self.config.page_cache_size <= 0:
+            self.page_cache = None
+        elif self.page_cache and self.page_cache.max_size == self.config.page_cache_size:
+            self.page_cache.update_config_hash(config_hash)
+        else:
+            self.page_cache = PageCache(self.config.page_cache_size, config_hash)
+            if self.config.cache_dir:
+                self.page_cache.load(Path(self.config.cache_dir) / PAGE_CACHE_FILE_NAME)
+
+        if not self.config.dependency_graph_file:
+            self.dependency_graph = None
+        elif self.dependency_graph is None:
+            # Pages loaded from the page cache are not rewritten, so their dependencies are taken from the previous build
+            self.dependency_graph = DependencyGraph.load(Path(self.config.dependency_graph_file))
+        self.replacer.dependency_graph = self.dependency_graph
+        self.diagnostics = Diagnostics(self.config.summarize_warnings)
+        self.replacer.diagnostics = self.diagnostics
+
+        if not self.config.validate_anchors:
+            self.anchor_index = None
+        elif self.anchor_index is None:
+            self.anchor_index = AnchorIndex()
+            if self.config.cache_dir:
+                self.anchor_index.load(Path(self.config.cache_dir) / ANCHOR_INDEX_FILE_NAME)
+        if self.anchor_index:
+            self.anchor_index.start_build()
+        # The links are collected while the pages are rewritten and validated in on_post_build
+        self.replacer.anchor_links = [] if self.anchor_index else None
+
+        if self.config.use_treeprocessor:
+            config.markdown_extensions.append(CrosslinkExtension(self, PROFILER))
+            if self.config.parallel_rewrite:
+                warning("'parallel_rewrite' is ignored, since 'use_treeprocessor' is enabled")
         return config
 
+    # Run after all other plugins, so that the files they generate are known
+    @event_priority(-100)
+    @PROFILER.profile
+    @CAPTURE.capture
+    def on_files(self, files: Files, config: MkDocsConfig) -> Files:
+        """
+        MkDocs already listed all files in docs_dir (and other plugins may have added generated files).
+        Crosslinks pointing to docs_dir (like 'local') use this list instead of walking the directory again.
+        """
+        docs_dir = os.path.abspath(config.docs_dir)
+        names = [crosslink.name for crosslink in self.crosslinks.values()
+                 if os.path.abspath(crosslink.source_dir) == docs_dir and not crosslink.mkdocs_config_file and not crosslink.index_file]
+        self.site_file_paths = get_site_file_paths(files, config)
+        if names:
+            self.replacer.set_file_list(names, self.site_file_paths)
+        return files
+
+    def on_serve(self, server: LiveReloadServer, config: MkDocsConfig, builder) -> LiveReloadServer:
+        if self.watcher:
+            self.watcher.start()
+            self.watch_file_caches()
+        return server
+
+    def rewrite_pages_parallel(self) -> None:
+        """
+        Rewrites the built HTML files of the pages collected in on_page_content using multiple processes
+        """
+        start_time = time.monotonic()
+        # Create the file caches once here (in parallel), instead of in every worker
+        self.replacer.create_file_caches(sorted(self.rewrite_crosslinks))
+        try:
+            results = rewrite_files_parallel(self.replacer, self.rewrite_tasks, self.config.rewrite_workers or None)
+        except Exception as error:
+            raise mkdocs.exceptions.PluginError(str(error))
+
+        # The warnings are shown in the order the pages were built, like when rewriting them in on_page_content
+        for result in results:
+            for message in result.warnings:
+                LOGGER.warning(message)
+            PROFILER.add_counters("Replacer", result.replacer_stats)
+            PROFILER.add_counters("Resolution cache", result.resolution_cache_stats)
+            for page, message in result.diagnostics:
+                self.diagnostics.add(page, message)
+            if self.replacer.anchor_links is not None:
+                self.replacer.anchor_links += result.anchor_links
+            if self.dependency_graph is not None:
+                self.dependency_graph.set_page_dependencies(result.src_path, result.dependencies)
+        info(f"Rewrote {len(self.rewrite_tasks)} page(s) in parallel in {time.monotonic() - start_time:0.2f} seconds")
+        self.rewrite_tasks = []
+        self.rewrite_crosslinks = set()
+
+    def watch_file_caches(self) -> None:
+        if self.watcher:
+            # Only the crosslinks that were actually used are watched. Crosslinks using a manifest are loaded again on every build
+            for name, cache in self.replacer.caches.items():
+                if not self.replacer.crosslinks[name].index_file:
+                    self.watcher.watch(cache.files_root)
+
+    def on_build_error(self, *, error: Exception) -> None:
+        # on_post_build is not called for failed builds, so the capture would continue in the next build
+        CAPTURE.reset()
+
+    def on_shutdown(self) -> None:
+        if self.watcher:
+            self.watcher.stop()
+
     @PROFILER.profile
+    @CAPTURE.capture
     def on_page_markdown(self, markdown: str, page: Page, config: MkDocsConfig, files: Files) -> str:
         """
         If the special flag is set, we can patch the source files so that we can migrate from plugins like ezlinks to this one.
         """
-        if self.config.dangerous_migrate_links:
+        self.current_page = page.file.src_path
+        if self.migrator:
             path = os.path.join(config.docs_dir, page.file.src_path)
             try:
-                patch_source_file_links_inplace(path, self.replacer)
+                patch_source_file_links_inplace(path, page.file.src_path, self.migrator)
             except Exception as ex:
                 raise mkdocs.exceptions.PluginError(f"Error migrating {path}: {ex}")
+        return markdown
 
     # @event_priority(50)
     # SEE https://www.mkdocs.org/dev-guide/plugins/#event-priorities
     @PROFILER.profile
+    @CAPTURE.capture
     def on_page_content(self, html: str, page: Page, config: MkDocsConfig, files: Files) -> str:
         """
         The page_content event is called after the Markdown text is rendered to HTML (but before being passed to a template) and can be used to alter the HTML body of the page.
         See: https://www.mkdocs.org/dev-guide/plugins/#on_page_content
         """
         if self.config.dangerous_migrate_links:
-            raise mkdocs.exceptions.PluginError("Build is aborted due to using the 'dangerous_migrate_links' option being enabled. Your source files have been patched, so disable this option again to actually build the site.")
+            # The build is aborted in on_post_build, after the source files of all pages were patched
+            return html
+        if self.config.use_treeprocessor:
+            # The links were already rewritten while the Markdown was rendered
+            return html
+        if self.config.parallel_rewrite:
+            # Only remember which pages need to be rewritten and which file caches they need.
+            # Pages that only use absolute paths (like 'x-NAME:/') do not need any file cache, but still need to be rewritten
+            if self.replacer.prefix_regex.search(html):
+                self.rewrite_tasks.append(RewriteTask(page.file.src_path, page.file.abs_dest_path))
+                self.rewrite_crosslinks.update(self.replacer.get_used_crosslinks(html))
+            elif self.dependency_graph is not None:
+                self.dependency_graph.start_page(page.file.src_path)
+            return html
+
         try:
-            html = self.replacer.handle_page(page.file.src_path, html)
+            start_time = time.monotonic()
+            html = self.rewrite_page(page.file.src_path, html)
+            PROFILER.record_page(page.file.src_path, time.monotonic() - start_time)
             return html
         except Exception as error:
             raise mkdocs.exceptions.PluginError(str(error))
 
+    def rewrite_page(self, file_name: str, html: str) -> str:
+        """
+        Rewrites the crosslinks on the page, unless the same page was already rewritten and the files of the crosslinks it uses did not change
+        """
+        if not self.page_cache:
+            return self.replacer.handle_page(file_name, html)
+
+        key = get_page_key(file_name, html)
+        anchor_links = self.replacer.anchor_links
+        if entry := self.page_cache.get(key, self.get_fingerprint):
+            for message in entry.warnings:
+                self.diagnostics.add(file_name, message)
+            # The targets of the links may have changed, so they are validated again
+            if anchor_links is not None:
+                anchor_links += entry.anchor_links
+            return entry.html
+
+        first_warning_index = len(self.diagnostics.occurrences)
+        first_anchor_link_index = len(anchor_links) if anchor_links is not None else 0
+        new_html = self.replacer.handle_page(file_name, html)
+        warnings = [message for _, message in self.diagnostics.occurrences[first_warning_index:]]
+        new_anchor_links = anchor_links[first_anchor_link_index:] if anchor_links is not None else []
+        fingerprints = {name: self.get_fingerprint(name) for name in self.replacer.get_used_crosslinks(html)}
+        # Names of glob crosslinks whose directory does not exist get an empty fingerprint, so that the page is rewritten once it is created
+        fingerprints.update({name: "" for name in self.replacer.get_missing_glob_names(html)})
+        self.page_cache.put(key, PageCacheEntry(new_html, fingerprints, warnings, new_anchor_links))
+        return new_html
+
+    @PROFILER.profile
+    def validate_anchor_links(self, anchor_index: AnchorIndex) -> None:
+        """
+        Validated after all pages were rewritten, so that each linked file is only parsed once (and in parallel)
+        """
+        self.replacer.validate_anchor_links(anchor_index)
+        PROFILER.add_counters("Anchor index", anchor_index.get_stats())
+        if self.config.cache_dir:
+            anchor_index.save(Path(self.config.cache_dir) / ANCHOR_INDEX_FILE_NAME)
+
+    def get_fingerprint(self, crosslink_name: str) -> str:
+        # A crosslink that no longer exists does not match any stored fingerprint
+        if self.replacer.find_crosslink(crosslink_name):
+            return self.replacer.get_file_cache(crosslink_name).get_fingerprint()
+        return ""
+
     def on_post_build(self, config: MkDocsConfig) -> None:
+        if self.config.dangerous_migrate_links:
+            raise mkdocs.exceptions.PluginError("Build is aborted due to using the 'dangerous_migrate_links' option being enabled. Your source files have been patched, so disable this option again to actually build the site.")
+        if self.rewrite_tasks:
+            self.rewrite_pages_parallel()
+        if self.anchor_index:
+            self.validate_anchor_links(self.anchor_index)
+        if self.config.manifest_export_file:
+            manifest_path = Path(config.site_dir) / self.config.manifest_export_file
+            write_manifest(manifest_path, FileCache(Path(config.docs_dir), relative_paths=self.site_file_paths), config.use_directory_urls)
+        if self.dependency_graph is not None:
+            self.dependency_graph.remove_other_pages(self.site_file_paths)
+            self.dependency_graph.save(Path(self.config.dependency_graph_file))
+        # Watch crosslinks that were used for the first time in this build
+        self.watch_file_caches()
+        self.diagnostics.log_summary()
+        if self.config.warnings_report_file:
+            self.diagnostics.write_report(Path(self.config.warnings_report_file))
+        PROFILER.add_counters("Replacer", self.replacer.get_stats())
+        PROFILER.add_counters("Resolution cache", self.replacer.resolution_cache.get_stats())
+        if self.page_cache:
+            PROFILER.add_counters("Page cache", self.page_cache.get_stats())
+            if self.config.cache_dir:
+                self.page_cache.save(Path(self.config.cache_dir) / PAGE_CACHE_FILE_NAME)
         if self.config.show_profiling_results:
-            PROFILER.log_stats()
+            PROFILER.log_stats(self.config.profiling_top_pages)
+        if self.config.profiling_report_file:
+            PROFILER.write_report(Path(self.config.profiling_report_file), self.config.profiling_top_pages)
+        if self.config.profiling_capture_dir:
+            CAPTURE.finish(Path(self.config.profiling_capture_dir))
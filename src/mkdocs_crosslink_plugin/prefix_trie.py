@@ -0,0 +1,32 @@
+from typing import Any
+
+
+class PrefixTrie:
+    """
+    Finds all stored strings that are a prefix of a given string.
+    The time needed only depends on the length of the longest match, not on the number of stored strings.
+    """
+    def __init__(self) -> None:
+        # Character -> child node. The special key None contains the values of strings ending at this node
+        self._root: dict[Any, Any] = {}
+
+    def add(self, key: str, value: str) -> None:
+        node = self._root
+        for char in key:
+            node = node.setdefault(char, {})
+        node.setdefault(None, []).append(value)
+
+    def get_prefixes_of(self, text: str) -> list[str]:
+        """
+        Returns the values of all keys that text starts with (shortest keys first)
+        """
+        results: list[str] = []
+        node = self._root
+        for char in text:
+            results += node.get(None, [])
+            child = node.get(char)
+            if child is None:
+                return results
+            node = child
+        results += node.get(None, [])
+        return results
@@ -1,11 +1,32 @@
+import json
+import math
 import time
 from functools import wraps
+from pathlib import Path
 # local
 from . import info
 
+# Increase this whenever the format of the JSON report changes
+REPORT_VERSION = 2
+
 class Profiler:
     def __init__(self) -> None:
         self.timing_map: dict[str, list[float]] = {}
+        # Crosslink -> time it took to create its file cache. Crosslinks indexed in parallel are measured on their own
+        self.file_cache_timings: dict[str, float] = {}
+        # Group name -> counter name -> value
+        self.counters: dict[str, dict[str, int]] = {}
+        # Page (src_path) -> time it took to process it in on_page_content
+        self.page_timings: dict[str, float] = {}
+
+    def reset(self) -> None:
+        """
+        Removes all recorded data, so that each build of 'mkdocs serve' is measured on its own
+        """
+        self.timing_map.clear()
+        self.file_cache_timings.clear()
+        self.counters.clear()
+        self.page_timings.clear()
 
     def profile(self, f):
         @wraps(f)
@@ -25,28 +46,94 @@ class Profiler:
             return result
         return wrap
     
-    def log_stats(self):
+    def record_file_cache(self, crosslink_name: str, time_taken: float) -> None:
+        # A cache may be created again in the same build (see Replacer.set_file_list)
+        self.file_cache_timings[crosslink_name] = self.file_cache_timings.get(crosslink_name, 0) + time_taken
+
+    def get_file_cache_timings(self) -> list[tuple[str, float]]:
+        # Slowest first
+        return sorted(self.file_cache_timings.items(), key=lambda x: x[1], reverse=True)
+
+    def record_page(self, page: str, time_taken: float) -> None:
+        self.page_timings[page] = time_taken
+
+    def get_slowest_pages(self, count: int) -> list[tuple[str, float]]:
+        return sorted(self.page_timings.items(), key=lambda x: x[1], reverse=True)[:count]
+
+    def add_counters(self, group: str, counters: dict[str, int]) -> None:
+        group_counters = self.counters.setdefault(group, {})
+        for name, value in counters.items():
+            group_counters[name] = group_counters.get(name, 0) + value
+
+    def log_stats(self, top_page_count: int = 10) -> None:
         for name, time_list in self.timing_map.items():
             count = len(time_list)
             time_sum = sum(time_list)
             message = f"(Profiler) Function '{name}' was called {count} time(s) and took {time_sum:0.2f} seconds."
             if count > 1:
-                # Statistics (min, max, avg, mean) only make sense when there are multiple values
-                sorted_time = list(sorted(time_list))
-                time_avg = time_sum / count
-                time_min = sorted_time[0]
-                time_max = sorted_time[-1]
+                # Statistics only make sense when there are multiple values
+                stats = get_time_stats(time_list)
+                message += "\nStats: " + " ".join([f"{key}={ms(stats[key])}" for key in ["min", "max", "avg", "p50", "p95", "p99"]])
 
-                mid_index = int(count / 2)
-                if count % 2 == 0:
-                    # Average of the two middle values
-                    time_mean = (sorted_time[mid_index-1] + sorted_time[mid_index]) / 2
-                else:
-                    time_mean = sorted_time[mid_index]
-
-                message += f"\nStats: min={ms(time_min)} max={ms(time_max)} avg={ms(time_avg)} mean={ms(time_mean)}"
+            info(message)
 
+        if self.page_timings:
+            stats = get_time_stats(list(self.page_timings.values()))
+            message = f"(Profiler) Replaced links on {len(self.page_timings)} page(s): " + " ".join([f"{key}={ms(stats[key])}" for key in ["p50", "p95", "p99"]])
+            if top_page_count > 0:
+                message += "\nSlowest pages: " + ", ".join([f"{page} ({ms(time_taken)})" for page, time_taken in self.get_slowest_pages(top_page_count)])
             info(message)
 
+        if self.file_cache_timings:
+            time_sum = sum(self.file_cache_timings.values())
+            details = ", ".join([f"{name} ({ms(time_taken)})" for name, time_taken in self.get_file_cache_timings()])
+            # The sum can be larger than the time the build waited, since crosslinks are indexed in parallel
+            info(f"(Profiler) Indexed {len(self.file_cache_timings)} crosslink(s), which took {time_sum:0.2f} seconds in total: {details}")
+
+        for group, counters in self.counters.items():
+            info(f"(Profiler) {group}: {', '.join([f'{value} {name}' for name, value in counters.items()])}")
+
+    def to_json(self, top_page_count: int = 10) -> dict:
+        """
+        Returns the recorded data in a machine readable format. All times are in seconds
+        """
+        return {
+            "version": REPORT_VERSION,
+            "functions": {name: {"count": len(time_list), "total": sum(time_list), **get_time_stats(time_list)}
+                          for name, time_list in self.timing_map.items()},
+            "pages": {
+                "count": len(self.page_timings),
+                **(get_time_stats(list(self.page_timings.values())) if self.page_timings else {}),
+                "slowest": [{"page": page, "time": time_taken} for page, time_taken in self.get_slowest_pages(top_page_count)],
+            },
+            "file_caches": [{"crosslink": name, "time": time_taken} for name, time_taken in self.get_file_cache_timings()],
+            "counters": self.counters,
+        }
+
+    def write_report(self, path: Path, top_page_count: int = 10) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(self.to_json(top_page_count), f, indent=4)
+        info(f"(Profiler) Wrote report to '{path}'")
+
+
+def get_time_stats(time_list: list[float]) -> dict[str, float]:
+    sorted_time = sorted(time_list)
+    return {
+        "min": sorted_time[0],
+        "max": sorted_time[-1],
+        "avg": sum(sorted_time) / len(sorted_time),
+        "p50": percentile(sorted_time, 50),
+        "p95": percentile(sorted_time, 95),
+        "p99": percentile(sorted_time, 99),
+    }
+
+
+def percentile(sorted_values: list[float], percent: float) -> float:
+    # Nearest-rank method: the smallest value, that is greater than or equal to the given percentage of values
+    index = max(math.ceil(len(sorted_values) * percent / 100) - 1, 0)
+    return sorted_values[index]
+
+
 def ms(time_in_seconds: float) -> str:
-    return f"{round(time_in_seconds * 1_000)}ms"
+    return f"{time_in_seconds * 1_000:0.2f}ms"
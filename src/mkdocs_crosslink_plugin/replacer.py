@@ -1,11 +1,45 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+import difflib
 import os
+from pathlib import Path
 import re
-from typing import Optional
+import time
+from typing import Iterable, NamedTuple, Optional
 import urllib
 # local files
 from . import warning, debug
-from .file_cache import FileCache
-from .config import CrosslinkSite, CrosslinkPluginConfig
+from .file_cache import FileCache, assert_is_directory, is_in_directory
+from .walker import walk_files_parallel
+from .snapshot import create_file_cache_with_snapshot
+from .mkdocs_files import list_mkdocs_project_files
+from .manifest import create_file_cache_from_manifest
+from .profiling import Profiler
+from .resolution_cache import Resolution, ResolutionCache
+from .prefix_trie import PrefixTrie
+from .dependency_graph import DependencyGraph
+from .diagnostics import Diagnostics
+from .anchor_index import AnchorIndex, AnchorLink, can_have_anchors
+from .config import CrosslinkSite, CrosslinkPluginConfig, GlobCrosslink, find_glob_crosslink
+
+
+# File caches created before the build (see orchestrator.py), keyed by get_file_cache_key. They are used instead of indexing the directories again
+SHARED_FILE_CACHES: dict[tuple[str, str, str], FileCache] = {}
+# Finds the start of every tag that one of the attribute regexes could match
+TAG_START_REGEX = re.compile(r"<(a|img)\s", re.IGNORECASE)
+# If a rewritten URL contains one of these, it could change how the regexes match other attributes
+UNSAFE_URL_CHARACTERS_REGEX = re.compile(r"[\s<>'\"]")
+# The first character that can not be part of an attribute value (in any of the quoting styles)
+ATTRIBUTE_VALUE_END_REGEX = UNSAFE_URL_CHARACTERS_REGEX
+
+
+def get_file_cache_key(crosslink: CrosslinkSite) -> tuple[str, str, str]:
+    """
+    Returns the values that the file cache of a crosslink depends on. Symlinks are resolved, like in the path of the snapshot file
+    """
+    return (os.path.realpath(crosslink.source_dir),
+            os.path.realpath(crosslink.mkdocs_config_file) if crosslink.mkdocs_config_file else "",
+            os.path.realpath(crosslink.index_file) if crosslink.index_file else "")
 
 
 def create_html_attribute_regex_patterns(tag: str, attribute: str) -> list[str]:
@@ -20,26 +54,240 @@ def create_html_attribute_regex_patterns(tag: str, attribute: str) -> list[str]:
         f"<{tag}\\s+[^>]*{attribute}\\s*=\\s*'([^']*)'",
     ]
 
+
+def create_percent_encoded_regex_pattern(text: str) -> str:
+    """
+    Creates a pattern that matches the text, where each character may also be percent-encoded (like ezlinks does it).
+    """
+    pattern = ""
+    for char in text:
+        # Hex digits may be upper or lower case, urllib.parse.unquote accepts both
+        encoded = "".join([f"%{byte >> 4:X}{byte & 0xF:X}" for byte in char.encode("utf-8")])
+        encoded_pattern = "".join([f"[{c}{c.lower()}]" if c.isalpha() else re.escape(c) for c in encoded])
+        pattern += f"(?:{re.escape(char)}|{encoded_pattern})"
+    return pattern
+
+
+class ProtoResolution(NamedTuple):
+    # The crosslink chosen for an ambiguous URL or None if none of them can resolve it
+    proto_name: Optional[str]
+    warnings: list[str]
+    # FileCache.generation of each matching crosslink (in sorted order) when this was resolved
+    generations: tuple[int,...]
+
+
+class BatchResolution(NamedTuple):
+    # The crosslink used to resolve the URL or None if the URL could not be resolved by any crosslink
+    crosslink_name: Optional[str]
+    # The URL the link would be rewritten to ('#crosslink-error' if no file matches)
+    final_url: str
+    # Warnings that would be shown if the URL was used in a page
+    warnings: list[str]
+
+    def is_error(self) -> bool:
+        return self.crosslink_name is None or self.final_url == "#crosslink-error"
+
+
+def create_file_cache_with_snapshot_timed(crosslink: CrosslinkSite, cache_dir: Path, rebuild: bool) -> tuple[FileCache, float]:
+    start_time = time.monotonic()
+    cache = create_file_cache_with_snapshot(crosslink.source_dir, cache_dir, rebuild, crosslink.manifest_file)
+    return cache, time.monotonic() - start_time
+
+
+def create_file_cache_timed(crosslink: CrosslinkSite, relative_paths: list[str], walk_time: float) -> tuple[FileCache, float]:
+    start_time = time.monotonic()
+    cache = FileCache(crosslink.source_dir, relative_paths=relative_paths)
+    return cache, walk_time + time.monotonic() - start_time
+
+
 class Replacer():
-    def __init__(self, crosslink_list: list[CrosslinkSite], config: CrosslinkPluginConfig) -> None:
+    def __init__(self, crosslink_list: list[CrosslinkSite], config: CrosslinkPluginConfig, profiler: Optional[Profiler] = None,
+                 caches: Optional[dict[str,FileCache]] = None, glob_crosslinks: Optional[list[GlobCrosslink]] = None) -> None:
         super().__init__()
         re_flags = re.IGNORECASE
-        self.regexes = []
-        self.regexes += [re.compile(pattern, re_flags) for pattern in create_html_attribute_regex_patterns("a", "href")]
-        self.regexes += [re.compile(pattern, re_flags) for pattern in create_html_attribute_regex_patterns("img", "src")]
+        # Tag name (as matched by TAG_START_REGEX) -> regexes for its attribute in the order they are applied
+        self.regexes_by_tag = {
+            "a": [re.compile(pattern, re_flags) for pattern in create_html_attribute_regex_patterns("a", "href")],
+            "img": [re.compile(pattern, re_flags) for pattern in create_html_attribute_regex_patterns("img", "src")],
+        }
+        self.regexes = self.regexes_by_tag["a"] + self.regexes_by_tag["img"]
 
+        self.config = config
+        self.profiler = profiler
         self.prefix = config.prefix
-        debug(f"Schema is '{config.prefix}NAME{config.suffix}'")
-        self.full_name = {}
-        self.caches = {}
-        self.crosslinks = {cl.name: cl for cl in crosslink_list}
+        # Matches the prefix, even if some of the characters are percent-encoded
+        self.prefix_regex = re.compile(create_percent_encoded_regex_pattern(config.prefix))
+        # A percent-encoded character in UTF-8 takes up to 4 * 3 characters
+        self.prefix_max_length = 12 * len(config.prefix)
+        debug("Schema is '%sNAME%s'", config.prefix, config.suffix)
+        self.full_name: dict[str,str] = {}
+        # The file caches are only created when a crosslink is used for the first time. See get_file_cache
+        # Caches from a previous build (that are still up to date) can be passed in to reuse them
+        self.caches: dict[str,FileCache] = dict(caches or {})
+        self.crosslinks: dict[str,CrosslinkSite] = {}
+        # Crosslinks with wildcards are only added when a matching name is used for the first time. See add_glob_crosslinks_for_url
+        self.glob_crosslinks = list(glob_crosslinks or [])
+        # Names that were already checked against glob_crosslinks (whether they matched or not)
+        self.checked_glob_names: set[str] = set()
+        self.resolution_cache = ResolutionCache(config.resolution_cache_size)
+        # Finds all crosslinks whose full name (like 'x-NAME:') is a prefix of an URL
+        self.full_name_trie = PrefixTrie()
+        # URL -> result of the ambiguity resolution in get_proto_for_url
+        self.proto_resolutions: dict[str,ProtoResolution] = {}
+        # If set, the crosslinks used by each page are recorded in it
+        self.dependency_graph: Optional[DependencyGraph] = None
+        # If set, warnings are passed to it instead of being logged directly (so that repeated ones can be summarized)
+        self.diagnostics: Optional[Diagnostics] = None
+        # If set, the links with a fragment are collected in it, so that they can be checked by validate_anchor_links after all pages were rewritten
+        self.anchor_links: Optional[list[AnchorLink]] = None
+        # If a target URL contains characters that are relevant to the regexes, only the sequential mode reproduces the exact output
+        self.single_pass_safe = True
         for crosslink in crosslink_list:
-            self.full_name[crosslink.name] = f"{config.prefix}{crosslink.name}{config.suffix}"
-            self.caches[crosslink.name] = FileCache(crosslink.source_dir)
-            debug(f"Cache for '{crosslink.name}': {self.caches[crosslink.name]}")
+            self.add_crosslink(crosslink)
+
+        # Counters for the profiler, see get_stats
+        self.candidate_count = 0
+        self.sequential_page_count = 0
+        self.rewrite_count = 0
+        self.lookup_count = 0
+        self.ambiguity_count = 0
+
+    def add_crosslink(self, crosslink: CrosslinkSite) -> None:
+        self.crosslinks[crosslink.name] = crosslink
+        self.full_name[crosslink.name] = f"{self.config.prefix}{crosslink.name}{self.config.suffix}"
+        self.full_name_trie.add(self.full_name[crosslink.name], crosslink.name)
+        if UNSAFE_URL_CHARACTERS_REGEX.search(crosslink.target_url):
+            self.single_pass_safe = False
+
+    def add_glob_crosslinks_for_url(self, url: str) -> None:
+        """
+        Adds the crosslinks, that glob crosslinks create for the names the URL could be using.
+        Only the directories of these names are checked, and each name is only checked once
+        """
+        for name in self.get_candidate_names(url):
+            self.find_crosslink(name)
+
+    def get_candidate_names(self, url: str) -> list[str]:
+        """
+        Returns the crosslink names that the URL could be using
+        """
+        names: list[str] = []
+        if not url.startswith(self.prefix):
+            return names
+        suffix = self.config.suffix
+        # The name may contain the suffix, so every occurrence of it could be the end of the name
+        end = url.find(suffix, len(self.prefix) + 1)
+        while end != -1:
+            names.append(url[len(self.prefix):end])
+            end = url.find(suffix, end + max(len(suffix), 1))
+        return names
+
+    def find_crosslink(self, name: str) -> Optional[CrosslinkSite]:
+        """
+        Returns the crosslink with the given name. If it was not defined manually, it is created from the glob crosslinks (if one matches)
+        """
+        if name not in self.crosslinks and name not in self.checked_glob_names:
+            self.checked_glob_names.add(name)
+            if crosslink := find_glob_crosslink(name, self.glob_crosslinks):
+                debug("glob expansion: Adding '%s' (%s)", name, crosslink.source_dir)
+                self.add_crosslink(crosslink)
+        return self.crosslinks.get(name)
+
+    def expand_glob_crosslinks(self) -> None:
+        """
+        Adds all crosslinks that the glob crosslinks can create. Manually defined crosslinks take precedence
+        """
+        for glob_crosslink in self.glob_crosslinks:
+            for crosslink in glob_crosslink.expand():
+                if crosslink.name in self.crosslinks:
+                    # It was probably added manually to overwrite this entry
+                    debug("glob expansion: Not adding '%s' (%s), because it already points to %s",
+                          crosslink.name, crosslink.source_dir, self.crosslinks[crosslink.name].source_dir)
+                else:
+                    debug("glob expansion: Adding '%s' (%s)", crosslink.name, crosslink.source_dir)
+                    self.add_crosslink(crosslink)
+        self.glob_crosslinks = []
 
 
     def handle_page(self, file_name: str, html: str) -> str:
+        if self.dependency_graph is not None:
+            self.dependency_graph.start_page(file_name)
+        if not self.prefix_regex.search(html):
+            # Quickly bail out if there can not be any crosslinks on this page
+            return html
+
+        candidates = self.find_candidates(html) if self.single_pass_safe else None
+        if candidates is None:
+            # Some tags overlap in weird ways. Use the slow mode, that applies the regexes one after another
+            self.sequential_page_count += 1
+            return self.handle_page_sequential(file_name, html)
+
+        self.candidate_count += len(candidates)
+
+        # Create all file caches needed by this page at once, so that they can be indexed in parallel
+        self.create_file_caches(self.get_required_file_caches([urllib.parse.unquote(match.group(1)) for _, match in candidates]))
+
+        # Resolve them in the same order as the sequential mode, so that the log messages are in the same order
+        replacements: list[tuple[int, int, str]] = []
+        for _regex_index, match in sorted(candidates, key=lambda x: (x[0], x[1].start())):
+            result = self.rewrite_url(file_name, urllib.parse.unquote(match.group(1)))
+            if result:
+                url, new_url = result
+                replacements.append((match.start(), match.end(), match.group(0).replace(url, new_url)))
+
+        # Build the output once from the unmodified parts and the updated tags
+        replacements.sort()
+        segments = []
+        position = 0
+        for start, end, updated_tag in replacements:
+            segments.append(html[position:start])
+            segments.append(updated_tag)
+            position = end
+        segments.append(html[position:])
+        return "".join(segments)
+
+
+    def find_candidates(self, html: str) -> Optional[list[tuple[int, re.Match]]]:
+        """
+        Scans the page once and returns all attributes, that start with the prefix, together with the index of the regex that found it.
+        Returns None if updating a tag could influence how other tags are matched. In this case the sequential mode needs to be used.
+        """
+        candidates: list[tuple[int, re.Match]] = []
+        tag_matches = list(TAG_START_REGEX.finditer(html))
+        previous_tag_end = -1
+        for index, tag_match in enumerate(tag_matches):
+            start = tag_match.start()
+            # The regexes can not cross a '>' before the attribute starts
+            tag_end = html.find(">", start)
+            if tag_end == -1:
+                tag_end = len(html)
+            # Is this tag inside of the previous tag (no '>' between them)?
+            nested = start < previous_tag_end
+            previous_tag_end = max(previous_tag_end, tag_end)
+
+            if not self.prefix_regex.search(html, start, tag_end + self.prefix_max_length):
+                # Quickly skip tags that do not contain the prefix
+                continue
+
+            next_tag_start = tag_matches[index + 1].start() if index + 1 < len(tag_matches) else len(html)
+            if len(tag_match.group(1)) == 1:
+                regexes, regex_offset = self.regexes_by_tag["a"], 0
+            else:
+                regexes, regex_offset = self.regexes_by_tag["img"], len(self.regexes_by_tag["a"])
+            tag_candidate_count = 0
+            for regex_index, regex in enumerate(regexes, regex_offset):
+                match = regex.match(html, start)
+                if match and self.prefix_regex.match(html, match.start(1), match.end(1)):
+                    url_full = urllib.parse.unquote(match.group(1))
+                    if url_full.startswith(self.prefix):
+                        tag_candidate_count += 1
+                        if nested or tag_candidate_count > 1 or match.end() > next_tag_start or UNSAFE_URL_CHARACTERS_REGEX.search(url_full):
+                            return None
+                        candidates.append((regex_index, match))
+        return candidates
+
+
+    def handle_page_sequential(self, file_name: str, html: str) -> str:
         file_contents = html
         for regex in self.regexes:
             search_start_pos = 0
@@ -65,6 +313,38 @@ class Replacer():
             # Quickly bail out if it is definitely not for us
             return (html, start + 1)
 
+        self.candidate_count += 1
+        if result := self.rewrite_url(file_name, url_full):
+            url, new_url_updated = result
+            # update the URL
+            updated_tag = html[start:end].replace(url, new_url_updated)
+            html = html[:start] + updated_tag + html[end:]
+            return (html, start + len(updated_tag))
+        else:
+            # No matches, seems to be a normal link
+            return (html, start + 1)
+
+    def rewrite_attribute_value(self, file_name: str, value: str) -> str:
+        """
+        Returns the value of an attribute containing a single URL (like an element's 'href') with the crosslink resolved.
+        If it is not a crosslink, the value is returned unchanged
+        """
+        url_full = urllib.parse.unquote(value)
+        if not url_full.startswith(self.prefix):
+            return value
+
+        self.candidate_count += 1
+        if result := self.rewrite_url(file_name, url_full):
+            url, new_url = result
+            # Like in the HTML mode only the URL is replaced. If it was percent-encoded, the unquoted value is used
+            return value.replace(url, new_url) if url in value else url_full.replace(url, new_url)
+        return value
+
+    def rewrite_url(self, file_name: str, url_full: str) -> Optional[tuple[str,str]]:
+        """
+        Resolves an unquoted URL starting with the prefix.
+        Returns the part of the URL to replace and its replacement, or None if it is not a crosslink.
+        """
         # If the URL ends with a hash (to jump to a section), we need to remove it and add it back after the URL is updated.
         parts = url_full.split("#", 1)
         if len(parts) == 2:
@@ -76,20 +356,209 @@ class Replacer():
 
         crosslink_name = self.get_proto_for_url(file_name, url)
         if crosslink_name:
-            new_url = self.resolve_crosslink(file_name, url, crosslink_name)
-            new_url_updated = self.update_file_url_if_needed(new_url, crosslink_name)
-            debug(f"Resolving: {url_full} -> {new_url + url_hash} -> {new_url_updated + url_hash}")
-
-            # update the URL
-            updated_tag = html[start:end].replace(url, new_url_updated)
-            html = html[:start] + updated_tag + html[end:]
-            return (html, start + len(updated_tag))
+            resolution = self.get_resolution(url, crosslink_name)
+            for message in resolution.warnings:
+                self.report_warning(file_name, message)
+            debug("Resolving: %s -> %s%s -> %s%s", url_full, resolution.url, url_hash, resolution.final_url, url_hash)
+            self.rewrite_count += 1
+            self.record_dependencies(file_name, url, crosslink_name, resolution.final_url)
+            if self.anchor_links is not None and len(url_hash) > 1 and resolution.final_url != "#crosslink-error":
+                target_path = self.get_target_path(url, crosslink_name)
+                if can_have_anchors(target_path):
+                    self.anchor_links.append(AnchorLink(file_name, url_full, crosslink_name, target_path, url_hash[1:]))
+            return (url, resolution.final_url)
         else:
-            # No matches, seems to be a normal link
-            return (html, start + 1)
+            # None of the matching crosslinks (if there are any) could resolve it
+            self.record_dependencies(file_name, url, None, "")
+            return None
+
+    def record_dependencies(self, file_name: str, url: str, chosen_name: Optional[str], final_url: str) -> None:
+        if self.dependency_graph is not None:
+            for name in self.get_matching_protos(url):
+                self.dependency_graph.add(file_name, name, url[len(self.full_name[name]):], final_url if name == chosen_name else "")
+
+    def get_target_path(self, crosslink_url: str, crosslink_name: str) -> str:
+        """
+        Returns the path (relative to the crosslink's source_dir) of the file that a resolvable URL (without the hash) points to
+        """
+        file_path = crosslink_url[len(self.full_name[crosslink_name]):]
+        if os.path.isabs(file_path):
+            return file_path.lstrip("/")
+        # Like in _resolve_crosslink, the first match is used if there are multiple
+        return min(self.get_file_cache(crosslink_name).get_matches(file_path))
+
+    def validate_anchor_links(self, anchor_index: AnchorIndex) -> None:
+        """
+        Shows a warning for every link in anchor_links, whose fragment is not an anchor in the target file.
+        The anchors of all target files are read at once, so that they can be parsed in parallel
+        """
+        assert self.anchor_links is not None
+        links_with_path = [(link, os.path.abspath(os.path.join(crosslink.source_dir, link.target_path))) for link in self.anchor_links
+                           if (crosslink := self.find_crosslink(link.crosslink_name)) is not None]
+        # 0 -> let Python choose the number of threads, 1 -> do everything in this thread
+        anchors_by_path = anchor_index.get_anchors([path for _, path in links_with_path], self.config.index_workers or None)
+
+        for link, path in links_with_path:
+            anchors = anchors_by_path[path]
+            # Files that can not be read (like the ones of crosslinks with an index_file) are not validated
+            if anchors is not None and link.fragment not in anchors:
+                message = f"Error resolving '{link.url}'. '{link.target_path}' has no heading or element with the id '{link.fragment}'"
+                if self.config.suggestion_count and (suggestions := difflib.get_close_matches(link.fragment, sorted(anchors), self.config.suggestion_count)):
+                    message += f". Did you mean: {', '.join(suggestions)}"
+                self.report_warning(link.page, message)
+        self.anchor_links = []
+
+    def get_resolution(self, crosslink_url: str, crosslink_name: str) -> Resolution:
+        """
+        Resolves the URL (without the hash) and updates it if needed. The results are cached, since the same links are often used on many pages.
+        """
+        key = (crosslink_name, crosslink_url[len(self.full_name[crosslink_name]):])
+        # Absolute paths do not depend on the file cache, so it does not matter if it does not exist yet
+        file_cache = self.caches.get(crosslink_name)
+        generation = file_cache.generation if file_cache else 0
+        if resolution := self.resolution_cache.get(key, generation):
+            return resolution
+
+        new_url, warnings = self._resolve_crosslink(crosslink_url, crosslink_name)
+        new_url_updated = self.update_file_url_if_needed(new_url, crosslink_name)
+        file_cache = self.caches.get(crosslink_name)
+        resolution = Resolution(new_url, new_url_updated, warnings, file_cache.generation if file_cache else 0)
+        self.resolution_cache.put(key, resolution)
+        return resolution
     
+    def get_file_cache(self, crosslink_name: str) -> FileCache:
+        """
+        Returns the file cache for the crosslink. It is created when this is called for the first time,
+        so that crosslinks that are never referenced do not need to be indexed.
+        """
+        if crosslink_name not in self.caches:
+            self.create_file_caches([crosslink_name])
+        return self.caches[crosslink_name]
+
+    def create_file_caches(self, crosslink_names: Iterable[str]) -> None:
+        """
+        Creates the file caches for the given crosslinks, if they do not exist yet.
+        The crosslinks (and the top-level directories of each one) are indexed in parallel.
+        """
+        missing_names = [name for name in dict.fromkeys(crosslink_names) if name not in self.caches]
+        if not missing_names:
+            return
+
+        # Crosslinks with the same file cache key (like 'alpha' and 'alpha:2') share one file cache, so that the directory is only
+        # indexed once and the threads do not write the same snapshot file at the same time
+        groups: dict[tuple[str, str, str], list[str]] = {}
+        for name in missing_names:
+            groups.setdefault(get_file_cache_key(self.crosslinks[name]), []).append(name)
+
+        # File cache key -> cache and the time it took to create it. Each one is measured on its own, even if they are created in parallel
+        timed_caches: dict[tuple[str, str, str], tuple[FileCache, float]] = {}
+        crosslinks = []
+        for key, names in groups.items():
+            crosslink = self.crosslinks[names[0]]
+            start_time = time.monotonic()
+            if (shared_cache := SHARED_FILE_CACHES.get(key)) is not None:
+                cache = shared_cache
+            elif crosslink.index_file:
+                cache = create_file_cache_from_manifest(crosslink)
+            elif crosslink.mkdocs_config_file:
+                # Other MkDocs projects are indexed with their own file listing
+                cache = FileCache(crosslink.source_dir, relative_paths=list_mkdocs_project_files(crosslink.mkdocs_config_file))
+            else:
+                crosslinks.append(crosslink)
+                continue
+            timed_caches[key] = (cache, time.monotonic() - start_time)
+
+        # 0 -> let Python choose the number of threads, 1 -> do everything in this thread
+        worker_count = self.config.index_workers or None
+        with ThreadPoolExecutor(worker_count) if worker_count != 1 else nullcontext() as executor:
+            if self.config.cache_dir:
+                cache_dir = Path(self.config.cache_dir)
+                if executor:
+                    futures = [executor.submit(create_file_cache_with_snapshot_timed, crosslink, cache_dir, self.config.rebuild_cache)
+                               for crosslink in crosslinks]
+                    walked_caches = [future.result() for future in futures]
+                else:
+                    walked_caches = [create_file_cache_with_snapshot_timed(crosslink, cache_dir, self.config.rebuild_cache) for crosslink in crosslinks]
+            else:
+                for crosslink in crosslinks:
+                    assert_is_directory(crosslink.source_dir)
+                file_lists, walk_times = walk_files_parallel([crosslink.source_dir for crosslink in crosslinks], executor)
+                walked_caches = [create_file_cache_timed(crosslink, file_list, walk_time)
+                                 for crosslink, file_list, walk_time in zip(crosslinks, file_lists, walk_times)]
+        for crosslink, timed_cache in zip(crosslinks, walked_caches):
+            timed_caches[get_file_cache_key(crosslink)] = timed_cache
+
+        caches: dict[str,FileCache] = {}
+        times: dict[str,float] = {}
+        for key, names in groups.items():
+            for name in names:
+                caches[name], times[name] = timed_caches[key]
+
+        for name in missing_names:
+            if self.profiler:
+                self.profiler.record_file_cache(name, times[name])
+            self.caches[name] = caches[name]
+            # Converting the cache to a string is expensive, so it is only done if debug messages are shown
+            debug("Cache for '%s': %s", name, caches[name])
+
+    def set_file_list(self, crosslink_names: list[str], relative_paths: list[str]) -> None:
+        """
+        Creates the file caches for the given crosslinks from an existing file listing (like the one MkDocs passes to on_files).
+        Caches that already exist are replaced.
+        """
+        for name in crosslink_names:
+            start_time = time.monotonic()
+            self.caches[name] = FileCache(self.crosslinks[name].source_dir, relative_paths=relative_paths)
+            if self.profiler:
+                self.profiler.record_file_cache(name, time.monotonic() - start_time)
+            debug("Cache for '%s' (from file list): %s", name, self.caches[name])
+
+    def get_required_file_caches(self, url_list: Iterable[str]) -> list[str]:
+        """
+        Returns the names of all crosslinks, whose file caches may be needed to resolve the given (unquoted) URLs
+        """
+        names = []
+        for url in url_list:
+            url = url.split("#", 1)[0]
+            for name in self.get_matching_protos(url):
+                if not os.path.isabs(url[len(self.full_name[name]):]):
+                    # Absolute paths are resolved without the file cache
+                    names.append(name)
+        return names
+
+    def get_page_urls(self, html: str) -> list[str]:
+        """
+        Returns the (unquoted) URLs on the page starting with the prefix.
+        This is much cheaper than finding the actual links, but may also return URLs that are only mentioned in the text.
+        """
+        urls = []
+        for match in self.prefix_regex.finditer(html):
+            end_match = ATTRIBUTE_VALUE_END_REGEX.search(html, match.end())
+            urls.append(urllib.parse.unquote(html[match.start():end_match.start() if end_match else len(html)]))
+        return urls
+
+    def get_used_crosslinks(self, html: str) -> list[str]:
+        """
+        Returns the names of all crosslinks that may be used on the page (see get_page_urls)
+        """
+        return list(dict.fromkeys(self.get_required_file_caches(self.get_page_urls(html))))
+
+    def get_missing_glob_names(self, html: str) -> list[str]:
+        """
+        Returns the names on the page that match a glob crosslink, but have no crosslink (since the directory does not exist).
+        If the directory is created later, find_crosslink creates the crosslink and the page needs to be rewritten again
+        """
+        names = [name for url in self.get_page_urls(html) for name in self.get_candidate_names(url)
+                 if not self.find_crosslink(name) and any(glob_crosslink.get_star_value(name) is not None for glob_crosslink in self.glob_crosslinks)]
+        return list(dict.fromkeys(names))
+
+    def get_matching_protos(self, url: str) -> list[str]:
+        if self.glob_crosslinks:
+            self.add_glob_crosslinks_for_url(url)
+        return self.full_name_trie.get_prefixes_of(url)
+
     def get_proto_for_url(self, file_name: str, url: str) -> Optional[str]:
-        proto_name_list = [name for name, full_name in self.full_name.items() if url.startswith(full_name)]
+        proto_name_list = self.get_matching_protos(url)
 
         if not proto_name_list:
             # None of our protocols match, so we return None
@@ -98,18 +567,74 @@ class Replacer():
             # Perfect, exactly one protocol matches -> return it
             return proto_name_list[0]
         else:
-            # Multiple protocols could match
-            # Best effort match: take the first one (after sorting) that can resolve a file, similar to file ambiguities
-            proto_name_list = list(sorted(proto_name_list))
-            warning(f"({file_name}) Ambiguity resolving '{url}'. Multiple crosslink protocols match: {', '.join(proto_name_list)}")
-            for proto_name in proto_name_list:
-                if self.can_resolve_crosslink(url, proto_name):
-                    debug(f"({file_name}) Ambiguity resolution for '{url}' chose protocol '{proto_name}'.")
-                    return proto_name
-            
+            resolution = self.get_proto_resolution(url, proto_name_list)
+            for message in resolution.warnings:
+                self.report_warning(file_name, message)
+            return resolution.proto_name
+
+    def get_proto_resolution(self, url: str, proto_name_list: list[str]) -> ProtoResolution:
+        # Multiple protocols could match. The result depends on the file caches, so it is only reused if none of them changed
+        generations = self.get_generations(proto_name_list)
+        resolution = self.proto_resolutions.get(url)
+        if resolution is None or resolution.generations != generations:
+            resolution = self.resolve_proto_ambiguity(url, proto_name_list)
+            self.proto_resolutions[url] = resolution
+        return resolution
+
+    def resolve_batch(self, urls: Iterable[str]) -> dict[str, BatchResolution]:
+        """
+        Resolves each of the (unquoted) URLs without a hash once, without rewriting a page. Warnings are returned instead of being shown.
+        The file caches of all crosslinks needed for them are created at the same time up front, so that they are indexed in parallel
+        """
+        unique_urls = list(dict.fromkeys(urls))
+        self.create_file_caches(self.get_required_file_caches(unique_urls))
+
+        results = {}
+        for url in unique_urls:
+            proto_name_list = self.get_matching_protos(url)
+            if not proto_name_list:
+                results[url] = BatchResolution(None, url, [f"Error resolving '{url}'. No crosslink with this name exists"])
+                continue
+
+            warnings = []
+            if len(proto_name_list) == 1:
+                crosslink_name: Optional[str] = proto_name_list[0]
+            else:
+                proto_resolution = self.get_proto_resolution(url, proto_name_list)
+                crosslink_name = proto_resolution.proto_name
+                warnings += proto_resolution.warnings
+
+            if crosslink_name:
+                resolution = self.get_resolution(url, crosslink_name)
+                results[url] = BatchResolution(crosslink_name, resolution.final_url, warnings + resolution.warnings)
+            else:
+                results[url] = BatchResolution(None, url, warnings)
+        return results
+
+    def resolve_proto_ambiguity(self, url: str, proto_name_list: list[str]) -> ProtoResolution:
+        # Best effort match: take the first one (after sorting) that can resolve a file, similar to file ambiguities
+        proto_name_list = list(sorted(proto_name_list))
+        self.ambiguity_count += 1
+        warnings = [f"Ambiguity resolving '{url}'. Multiple crosslink protocols match: {', '.join(proto_name_list)}"]
+        chosen_proto_name = None
+        for proto_name in proto_name_list:
+            if self.can_resolve_crosslink(url, proto_name):
+                debug("Ambiguity resolution for '%s' chose protocol '%s'.", url, proto_name)
+                chosen_proto_name = proto_name
+                break
+
+        if chosen_proto_name is None:
             # Ok, this is worse, none of the protocols match. The user must fix it
-            warning(f"({file_name}) Ambiguity resolution for '{url}' found no potential matches'.")
-            return None
+            warnings.append(f"Ambiguity resolution for '{url}' found no potential matches'.")
+
+        # can_resolve_crosslink may have created file caches, so we get the generations afterwards
+        return ProtoResolution(chosen_proto_name, warnings, self.get_generations(proto_name_list))
+
+    def get_generations(self, crosslink_names: list[str]) -> tuple[int,...]:
+        """
+        Returns the generation of each crosslink's file cache (sorted by name). Caches that were not created yet count as generation 0
+        """
+        return tuple([cache.generation if (cache := self.caches.get(name)) else 0 for name in sorted(crosslink_names)])
 
     def can_resolve_crosslink(self, crosslink_url: str, crosslink_name: str) -> bool:
         """
@@ -122,34 +647,68 @@ class Replacer():
             # Absolute URL should work -> true
             return True
         else:
-            cache = self.caches[crosslink_name]
+            cache = self.get_file_cache(crosslink_name)
             results = cache.get_matches(file_path)
+            self.lookup_count += 1
             # We do not care if there is an ambiguity in the file path, just whether there are results
             return len(results) > 0
 
     def resolve_crosslink(self, file_name: str, crosslink_url: str, crosslink_name: str) -> str:
+        new_url, warnings = self._resolve_crosslink(crosslink_url, crosslink_name)
+        for message in warnings:
+            self.report_warning(file_name, message)
+        return new_url
+
+    def report_warning(self, file_name: str, message: str) -> None:
+        if self.diagnostics is not None:
+            self.diagnostics.add(file_name, message)
+        else:
+            warning("(%s) %s", file_name, message)
+
+    def _resolve_crosslink(self, crosslink_url: str, crosslink_name: str) -> tuple[str,list[str]]:
+        """
+        Returns the resolved URL and the warnings that should be shown to the user
+        """
         base_url = self.crosslinks[crosslink_name].target_url
         crosslink_proto = self.full_name[crosslink_name]
         file_path = crosslink_url[len(crosslink_proto):] # Get everything after the proto.
-        debug(f"Split URL: {crosslink_url} -> ({crosslink_proto}, {file_path})")
+        debug("Split URL: %s -> (%s, %s)", crosslink_url, crosslink_proto, file_path)
         if not os.path.isabs(file_path):
-            cache = self.caches[crosslink_name]
+            cache = self.get_file_cache(crosslink_name)
             results = cache.get_matches(file_path)
+            self.lookup_count += 1
             if not results:
-                warning(f"({file_name}) Error resolving '{crosslink_url}'. Could not find a file matching '{file_path}' in {cache.files_root}")
-                return "#crosslink-error"
-            elif len(results) == 1:
+                # The configured path is shown, since the cache may be shared and use an absolute one (see orchestrator.py)
+                message = f"Error resolving '{crosslink_url}'. Could not find a file matching '{file_path}' in {self.crosslinks[crosslink_name].source_dir}"
+                if self.config.suggestion_count and (suggestions := cache.get_suggestions(file_path, self.config.suggestion_count)):
+                    message += f". Did you mean: {', '.join(suggestions)}"
+                return ("#crosslink-error", [message])
+
+            warnings = []
+            if not is_in_directory(results[0], file_path):
+                # get_matches ignored the directories, so the link may point to an unrelated file with the same name
+                warnings.append(f"Directories of '{crosslink_url}' ignored. No file matching '{file_path}' exists, using a file with the same name instead")
+            if len(results) == 1:
                 # Only one result -> use it
-                return join_url(base_url, results[0])
+                return (join_url(base_url, results[0]), warnings)
             else:
                 # Multipe results. Send a warning. Since I do not (yet) know which is the best,
                 # I sort them (to make it predictable) and return the first one
                 sorted_results = list(sorted(results))
-                warning(f"({file_name}) Ambiguity resolving '{crosslink_url}'. Got {len(results)} matches: {', '.join(sorted_results)}")
-                return join_url(base_url, sorted_results[0])
+                self.ambiguity_count += 1
+                return (join_url(base_url, sorted_results[0]), warnings + [f"Ambiguity resolving '{crosslink_url}'. Got {len(results)} matches: {', '.join(sorted_results)}"])
         else:
             # It is an absolute path -> disregard the lookup rules and take it at face value
-            return join_url(base_url, file_path)
+            return (join_url(base_url, file_path), [])
+
+    def get_stats(self) -> dict[str,int]:
+        return {
+            "candidate matches": self.candidate_count,
+            "pages using the sequential mode": self.sequential_page_count,
+            "links rewritten": self.rewrite_count,
+            "index lookups": self.lookup_count,
+            "ambiguities": self.ambiguity_count,
+        }
 
     def update_file_url_if_needed(self, url: str, crosslink_name: str) -> str:
         lower_url = url.lower()
@@ -0,0 +1,52 @@
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+
+class Resolution(NamedTuple):
+    # URL returned by Replacer.resolve_crosslink
+    url: str
+    # URL after Replacer.update_file_url_if_needed was applied
+    final_url: str
+    # Warnings that were shown while resolving the URL (without the page's file name), so that they can be repeated for cache hits
+    warnings: list[str]
+    # FileCache.generation at the time this was resolved. If the file cache changed since then, the entry is outdated
+    generation: int
+
+
+class ResolutionCache:
+    """
+    Least recently used cache mapping (crosslink name, path) to the resolved URL.
+    A size of 0 disables the cache.
+    """
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self._data: OrderedDict[tuple[str,str], Resolution] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: tuple[str,str], generation: int) -> Optional[Resolution]:
+        resolution = self._data.get(key)
+        if resolution is not None and resolution.generation == generation:
+            self._data.move_to_end(key)
+            self.hits += 1
+            return resolution
+        else:
+            self.misses += 1
+            return None
+
+    def put(self, key: tuple[str,str], resolution: Resolution) -> None:
+        if self.max_size <= 0:
+            return
+
+        self._data[key] = resolution
+        self._data.move_to_end(key)
+        if len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def get_stats(self) -> dict[str,int]:
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions}
@@ -0,0 +1,139 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+import tempfile
+from typing import Any, Optional
+# local
+from . import debug, warning
+from .file_cache import FileCache
+from .walker import list_directory
+
+# Increase this whenever the format of the snapshot files changes, so that old snapshots are ignored
+SNAPSHOT_VERSION = 1
+
+
+class DirectorySnapshot:
+    """
+    Stores the listing of every directory of a source_dir together with the directory's mtime and size.
+    Adding, removing or renaming an entry updates the mtime of the directory containing it,
+    so only directories with a different mtime/size need to be listed again.
+    """
+    def __init__(self, directories: Optional[dict[str, dict[str, Any]]] = None, manifest_hash: str = "") -> None:
+        # Relative directory path ("" for the root) -> {"mtime": int, "size": int, "files": [...], "dirs": [...]}
+        # The order is the same as the order in which the directories were walked
+        self.directories = directories or {}
+        self.manifest_hash = manifest_hash
+
+    def get_file_paths(self) -> list[str]:
+        file_paths = []
+        for dir_path, data in self.directories.items():
+            prefix = f"{dir_path}/" if dir_path else ""
+            file_paths += [prefix + name for name in data["files"]]
+        return file_paths
+
+    def update(self, files_root: Path) -> tuple["DirectorySnapshot", int]:
+        """
+        Returns a new snapshot of files_root and the number of directories that had to be listed again.
+        Only changed directories (and new subdirectories) are listed, everything else is taken from this snapshot.
+        """
+        new_snapshot = DirectorySnapshot(manifest_hash=self.manifest_hash)
+        changed_count = self._update_directory(files_root, "", new_snapshot.directories)
+        return new_snapshot, changed_count
+
+    def _update_directory(self, path: Path, relative_path: str, new_directories: dict[str, dict[str, Any]]) -> int:
+        changed_count = 0
+        try:
+            stat = os.stat(path)
+            old = self.directories.get(relative_path)
+            if old and old["mtime"] == stat.st_mtime_ns and old["size"] == stat.st_size:
+                files, dirs = old["files"], old["dirs"]
+            else:
+                files, dirs = list_directory(path)
+                changed_count += 1
+            new_directories[relative_path] = {"mtime": stat.st_mtime_ns, "size": stat.st_size, "files": files, "dirs": dirs}
+        except (FileNotFoundError, NotADirectoryError, PermissionError):
+            # Same behavior as rglob: directories that can not be accessed (or were replaced by a file) are ignored
+            return changed_count
+
+        for name in dirs:
+            child_relative_path = f"{relative_path}/{name}" if relative_path else name
+            changed_count += self._update_directory(path / name, child_relative_path, new_directories)
+        return changed_count
+
+    def to_json(self, source_dir: Path) -> dict:
+        return {
+            "version": SNAPSHOT_VERSION,
+            "source_dir": str(source_dir.resolve()),
+            "manifest_hash": self.manifest_hash,
+            "directories": self.directories,
+        }
+
+    @staticmethod
+    def from_json(data: dict, source_dir: Path) -> Optional["DirectorySnapshot"]:
+        if data.get("version") != SNAPSHOT_VERSION or data.get("source_dir") != str(source_dir.resolve()):
+            return None
+        return DirectorySnapshot(data["directories"], data.get("manifest_hash", ""))
+
+
+def get_snapshot_path(cache_dir: Path, source_dir: Path) -> Path:
+    # Use a hash of the absolute path, so that crosslinks with the same directory share the snapshot
+    path_hash = hashlib.sha256(str(source_dir.resolve()).encode()).hexdigest()[:32]
+    return cache_dir / f"{path_hash}.json"
+
+
+def hash_file(path: Path) -> str:
+    try:
+        return hashlib.sha256(path.read_bytes()).hexdigest()
+    except OSError:
+        # If the manifest does not exist (yet), fall back to checking the directories
+        return ""
+
+
+def load_snapshot(snapshot_path: Path, source_dir: Path) -> Optional[DirectorySnapshot]:
+    try:
+        with open(snapshot_path) as f:
+            return DirectorySnapshot.from_json(json.load(f), source_dir)
+    except FileNotFoundError:
+        return None
+    except Exception as ex:
+        warning(f"Ignoring invalid cache file '{snapshot_path}': {ex}")
+        return None
+
+
+def save_snapshot(snapshot_path: Path, snapshot: DirectorySnapshot, source_dir: Path) -> None:
+    snapshot_path.parent.mkdir(parents=True, exist_ok=True)
+    # Write to a temporary file first, so that an interrupted build can not leave a broken cache file behind.
+    # The name is unique, since other threads and processes may write the same snapshot at the same time
+    fd, temp_path = tempfile.mkstemp(prefix=snapshot_path.name + ".", suffix=".tmp", dir=snapshot_path.parent)
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(snapshot.to_json(source_dir), f)
+        os.replace(temp_path, snapshot_path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def create_file_cache_with_snapshot(source_dir: Path, cache_dir: Path, rebuild: bool, manifest_file: Optional[Path] = None) -> FileCache:
+    """
+    Creates a FileCache from the snapshot stored in cache_dir, updating the snapshot if the directory has changed.
+    """
+    if not source_dir.is_dir():
+        raise Exception(f"Directory '{source_dir}' does not exist")
+
+    snapshot_path = get_snapshot_path(cache_dir, source_dir)
+    old_snapshot = None if rebuild else load_snapshot(snapshot_path, source_dir)
+    manifest_hash = hash_file(manifest_file) if manifest_file else ""
+
+    if old_snapshot and manifest_hash and old_snapshot.manifest_hash == manifest_hash:
+        # The manifest is unchanged, so we trust the snapshot without checking any directories
+        debug("Using cached index for '%s' (manifest unchanged)", source_dir)
+        return FileCache(source_dir, relative_paths=old_snapshot.get_file_paths())
+
+    snapshot, changed_count = (old_snapshot or DirectorySnapshot()).update(source_dir)
+    snapshot.manifest_hash = manifest_hash
+    debug("Cached index for '%s': %d of %d directories had to be listed again", source_dir, changed_count, len(snapshot.directories))
+    if changed_count > 0 or old_snapshot is None or old_snapshot.manifest_hash != manifest_hash:
+        save_snapshot(snapshot_path, snapshot, source_dir)
+    return FileCache(source_dir, relative_paths=snapshot.get_file_paths())
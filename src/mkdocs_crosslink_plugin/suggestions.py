@@ -0,0 +1,116 @@
+from array import array
+from collections import Counter
+import itertools
+import math
+import re
+from typing import Iterable
+
+# Keys that only differ in these characters (and case) are considered equal
+SEPARATOR_REGEX = re.compile(r"[-_\s]+")
+# Marks the start and end of a key, so that matching prefixes and suffixes count more
+PADDING = "\0"
+# Maximum number of key IDs counted per query. The postings of the rarest trigrams are counted first, common ones (like '.md')
+# are skipped once this is reached, since they barely narrow down the results. The similarity of the candidates is still computed with all trigrams
+MAX_COUNTED_IDS = 2_000
+# Number of candidates (with the most shared trigrams) whose similarity is computed
+CANDIDATE_COUNT = 50
+# Minimum similarity (Dice coefficient of the trigram sets, 0 to 1) of a suggestion
+MIN_SIMILARITY = 0.5
+
+
+def normalize_key(key: str) -> str:
+    return SEPARATOR_REGEX.sub("-", key.lower())
+
+
+def get_trigrams(normalized_key: str) -> set[str]:
+    padded = f"{PADDING}{normalized_key}{PADDING}"
+    return {padded[index:index + 3] for index in range(len(padded) - 2)}
+
+
+def get_swapped_keys(normalized_key: str) -> list[str]:
+    return [normalized_key[:index] + normalized_key[index + 1] + normalized_key[index] + normalized_key[index + 2:]
+            for index in range(len(normalized_key) - 1) if normalized_key[index] != normalized_key[index + 1]]
+
+
+def get_similarity(trigrams_a: set[str], trigrams_b: set[str]) -> float:
+    return 2 * len(trigrams_a & trigrams_b) / (len(trigrams_a) + len(trigrams_b))
+
+
+class SuggestionIndex:
+    """
+    Finds keys of a FileCache that are similar to a key without a match (for 'Did you mean ...' messages).
+    Keys that are equal except for case and separators are found with a dictionary, all others with a trigram index
+    """
+    def __init__(self, keys: Iterable[str]) -> None:
+        self._keys: list[str] = []
+        self._normalized_keys: list[str] = []
+        # Normalized key -> IDs (indices in _keys) of the keys
+        self._normalized: dict[str, list[int]] = {}
+        # Trigram of the normalized keys -> IDs of the keys containing it
+        self._trigrams: dict[str, "array[int]"] = {}
+        for key in dict.fromkeys(keys):
+            key_id = len(self._keys)
+            self._keys.append(key)
+            normalized_key = normalize_key(key)
+            # Most keys are already normalized, so the same string object can be used
+            self._normalized_keys.append(key if normalized_key == key else normalized_key)
+            self._normalized.setdefault(normalized_key, []).append(key_id)
+            for trigram in get_trigrams(normalized_key):
+                if (posting := self._trigrams.get(trigram)) is None:
+                    self._trigrams[trigram] = array("I", [key_id])
+                else:
+                    posting.append(key_id)
+
+    def get_suggestions(self, key: str, max_count: int) -> list[str]:
+        """
+        Returns up to max_count keys similar to the given one, the most similar first
+        """
+        normalized_key = normalize_key(key)
+        # Keys that only differ in case or separators are always the best suggestions.
+        # Next are the ones with two adjacent characters swapped (like 'jqeury'), which share too few trigrams to be found below
+        suggestions = sorted([self._keys[key_id] for key_id in self._normalized.get(normalized_key, []) if self._keys[key_id] != key])
+        suggestions += sorted({self._keys[key_id] for swapped_key in get_swapped_keys(normalized_key)
+                               for key_id in self._normalized.get(swapped_key, [])})
+        if len(suggestions) >= max_count:
+            return suggestions[:max_count]
+
+        trigrams = get_trigrams(normalized_key)
+        postings = sorted([posting for trigram in trigrams if (posting := self._trigrams.get(trigram)) is not None], key=len)
+        counter: Counter[int] = Counter()
+        counted_ids = 0
+        used_posting_count = 0
+        for posting in postings:
+            if counted_ids + len(posting) > MAX_COUNTED_IDS:
+                if used_posting_count:
+                    break
+                # Even the rarest trigram is common. Only a part of its keys is used, so the work per query stays bounded
+                posting = posting[:MAX_COUNTED_IDS]
+            counter.update(posting)
+            counted_ids += len(posting)
+            used_posting_count += 1
+
+        # A key needs to share at least this many trigrams to reach MIN_SIMILARITY (a key with fewer trigrams can not share more),
+        # so it has at least this many minus the number of skipped trigrams in the counted postings
+        min_shared_count = math.ceil(MIN_SIMILARITY * len(trigrams) / (2 - MIN_SIMILARITY))
+        min_count = max(1, min_shared_count - (len(trigrams) - used_posting_count))
+        # Sorting all keys by their count would be slow. Instead the lowest count that still results in enough candidates is used
+        candidate_count = 0
+        for count, key_count in sorted(Counter(counter.values()).items(), reverse=True):
+            candidate_count += key_count
+            if count <= min_count or candidate_count >= CANDIDATE_COUNT:
+                min_count = max(count, min_count)
+                break
+        candidates = [key_id for key_id, count in counter.items() if count > min_count]
+        candidates += itertools.islice((key_id for key_id, count in counter.items() if count == min_count), CANDIDATE_COUNT - len(candidates))
+
+        ranked = []
+        for key_id in candidates:
+            candidate = self._keys[key_id]
+            normalized_candidate = self._normalized_keys[key_id]
+            if normalized_candidate != normalized_key and candidate not in suggestions:
+                similarity = get_similarity(trigrams, get_trigrams(normalized_candidate))
+                if similarity >= MIN_SIMILARITY:
+                    # Same similarity -> prefer the one with the closest length, then sort alphabetically to make it predictable
+                    ranked.append((-similarity, abs(len(candidate) - len(key)), candidate))
+        ranked.sort()
+        return suggestions + [candidate for _, _, candidate in ranked[:max_count - len(suggestions)]]
@@ -0,0 +1,96 @@
+import re
+import time
+from typing import TYPE_CHECKING
+import xml.etree.ElementTree as etree
+# pip dependencies
+from markdown import Extension, Markdown
+from markdown.treeprocessors import Treeprocessor
+# local
+from .profiling import Profiler
+from .replacer import Replacer
+if TYPE_CHECKING:
+    from .plugin import CrosslinkPlugin
+
+# Attributes that contain a single URL
+URL_ATTRIBUTES = {"href", "src", "poster", "data", "action", "formaction", "cite", "background", "longdesc", "manifest", "xlink:href"}
+# Attributes that contain a comma separated list of URLs, each optionally followed by a descriptor (like 'image.png 2x, big.png 1000w')
+SRCSET_ATTRIBUTES = {"srcset", "imagesrcset"}
+# An attribute in raw HTML with its value in double quotes, single quotes or without quotes
+RAW_HTML_ATTRIBUTE_REGEX = re.compile(r"""(?<=\s)([\w:-]+)\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'=<>`]+))""")
+
+
+class CrosslinkTreeprocessor(Treeprocessor):
+    """
+    Rewrites the crosslinks in the element tree of a page, so that the HTML does not need to be scanned again in on_page_content
+    """
+    def __init__(self, md: Markdown, plugin: "CrosslinkPlugin", profiler: Profiler) -> None:
+        super().__init__(md)
+        self.plugin = plugin
+        self.profiler = profiler
+
+    def run(self, root: etree.Element) -> None:
+        start_time = time.monotonic()
+        replacer = self.plugin.replacer
+        file_name = self.plugin.current_page
+        if replacer.dependency_graph is not None:
+            replacer.dependency_graph.start_page(file_name)
+
+        for element in root.iter():
+            for name, value in list(element.attrib.items()):
+                if replacer.prefix_regex.search(value):
+                    element.set(name, rewrite_attribute(replacer, file_name, name, value))
+
+        # Raw HTML in the Markdown is not part of the tree, so its attributes are found with a regex
+        stash = self.md.htmlStash.rawHtmlBlocks
+        for index, block in enumerate(stash):
+            if isinstance(block, str) and replacer.prefix_regex.search(block):
+                stash[index] = rewrite_raw_html(replacer, file_name, block)
+
+        self.profiler.record_page(file_name, time.monotonic() - start_time)
+
+
+def rewrite_attribute(replacer: Replacer, file_name: str, name: str, value: str) -> str:
+    name = name.lower()
+    if name in URL_ATTRIBUTES:
+        return replacer.rewrite_attribute_value(file_name, value)
+    elif name in SRCSET_ATTRIBUTES:
+        return rewrite_srcset(replacer, file_name, value)
+    else:
+        return value
+
+
+def rewrite_raw_html(replacer: Replacer, file_name: str, html: str) -> str:
+    segments = []
+    position = 0
+    for match in RAW_HTML_ATTRIBUTE_REGEX.finditer(html):
+        value_group = next(group for group in (2, 3, 4) if match.group(group) is not None)
+        value = match.group(value_group)
+        if replacer.prefix_regex.search(value):
+            segments.append(html[position:match.start(value_group)])
+            segments.append(rewrite_attribute(replacer, file_name, match.group(1), value))
+            position = match.end(value_group)
+    segments.append(html[position:])
+    return "".join(segments)
+
+
+def rewrite_srcset(replacer: Replacer, file_name: str, value: str) -> str:
+    candidates = []
+    for candidate in value.split(","):
+        if stripped := candidate.strip():
+            # Only the URL is replaced, so that the descriptor and whitespace stay the same
+            url = stripped.split(None, 1)[0]
+            start = candidate.index(url)
+            candidate = candidate[:start] + replacer.rewrite_attribute_value(file_name, url) + candidate[start + len(url):]
+        candidates.append(candidate)
+    return ",".join(candidates)
+
+
+class CrosslinkExtension(Extension):
+    def __init__(self, plugin: "CrosslinkPlugin", profiler: Profiler) -> None:
+        super().__init__()
+        self.plugin = plugin
+        self.profiler = profiler
+
+    def extendMarkdown(self, md: Markdown) -> None:
+        # Run after MkDocs' 'relpath' treeprocessor (priority 0), so that it does not check the rewritten URLs
+        md.treeprocessors.register(CrosslinkTreeprocessor(md, self.plugin, self.profiler), "crosslink", -10)
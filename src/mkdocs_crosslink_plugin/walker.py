@@ -0,0 +1,98 @@
+from concurrent.futures import Executor, Future
+import os
+from pathlib import Path
+import time
+from typing import Optional
+
+
+def list_directory(path: Path) -> tuple[list[str], list[str]]:
+    """
+    Returns the names of the files and subdirectories in the given directory.
+    Like rglob: symlinks to files count as files, but symlinks to directories are not followed.
+    The type information from scandir is reused, so no additional stat calls are needed in most cases.
+    """
+    files, dirs = [], []
+    with os.scandir(path) as iterator:
+        for entry in iterator:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    dirs.append(entry.name)
+                elif entry.is_file():
+                    files.append(entry.name)
+            except OSError:
+                pass
+    return files, dirs
+
+
+def walk_files(path: Path, relative_path: str = "") -> list[str]:
+    """
+    Returns the paths of all files below path (relative to the original root and with Unix path separators).
+    The files are returned in the same order as rglob would: files of a directory first, then its subdirectories (depth first).
+    """
+    result: list[str] = []
+    _walk_files(path, relative_path, result)
+    return result
+
+
+def _walk_files(path: Path, relative_path: str, result: list[str]) -> None:
+    try:
+        files, dirs = list_directory(path)
+    except (FileNotFoundError, NotADirectoryError, PermissionError):
+        # Same behavior as rglob: directories that can not be accessed are ignored
+        return
+
+    prefix = f"{relative_path}/" if relative_path else ""
+    result += [prefix + name for name in files]
+    for name in dirs:
+        _walk_files(path / name, prefix + name, result)
+
+
+def walk_files_timed(path: Path, relative_path: str = "") -> tuple[list[str], float]:
+    start_time = time.monotonic()
+    return walk_files(path, relative_path), time.monotonic() - start_time
+
+
+def walk_files_parallel(roots: list[Path], executor: Optional[Executor]) -> tuple[list[list[str]], list[float]]:
+    """
+    Lists all files below each of the roots. The subtrees of the top-level directories are walked in the executor,
+    so that both multiple roots and a single large root are split across the workers.
+    The results are identical to calling walk_files for each root.
+    Also returns the time spent on each root (summed over the workers, so it is not affected by the other roots walked at the same time)
+    """
+    if executor is None:
+        timed_results = [walk_files_timed(root) for root in roots]
+        return [files for files, _ in timed_results], [time_taken for _, time_taken in timed_results]
+
+    # The roots are listed directly, so that workers never need to wait for other tasks (which could otherwise deadlock the pool)
+    pending: list[tuple[list[str], float, list[Future]]] = []
+    for root in roots:
+        start_time = time.monotonic()
+        files, dirs = list_directory(root)
+        list_time = time.monotonic() - start_time
+        futures = [executor.submit(walk_files_timed, root / name, name) for name in dirs]
+        pending.append((files, list_time, futures))
+
+    results = []
+    times = []
+    for files, time_taken, futures in pending:
+        for future in futures:
+            subtree_files, subtree_time = future.result()
+            files.extend(subtree_files)
+            time_taken += subtree_time
+        results.append(files)
+        times.append(time_taken)
+    return results, times
+
+
+def find_markdown_files(paths: list[str], docs_dir: str) -> list[tuple[str, str]]:
+    """
+    Returns (path, file name relative to docs_dir) of all Markdown files below the given paths (files or directories), sorted by file name
+    """
+    result = []
+    for path in paths:
+        file_paths = [os.path.join(path, file_path) for file_path in walk_files(Path(path))] if os.path.isdir(path) else [path]
+        for file_path in file_paths:
+            if file_path.lower().endswith(".md"):
+                result.append((file_path, os.path.relpath(file_path, docs_dir).replace("\\", "/")))
+    result.sort(key=lambda item: item[1])
+    return result
@@ -0,0 +1,106 @@
+import os
+from pathlib import Path
+import threading
+from typing import Optional
+# pip dependencies (watchdog is required by mkdocs)
+from watchdog.events import FileSystemEvent, FileSystemEventHandler
+from watchdog.observers import Observer
+from watchdog.observers.api import BaseObserver
+# local
+from . import debug, warning
+from .config import CrosslinkSite
+from .file_cache import FileCache, normalize_path_str
+
+# Events that change which files exist. Modifications of a file's content do not matter for the index
+RELEVANT_EVENT_TYPES = {"created", "deleted", "moved"}
+
+
+class _EventCollector(FileSystemEventHandler):
+    def __init__(self, watcher: "IndexWatcher", root: str) -> None:
+        super().__init__()
+        self.watcher = watcher
+        self.root = root
+
+    def on_any_event(self, event: FileSystemEvent) -> None:
+        if event.event_type in RELEVANT_EVENT_TYPES:
+            self.watcher.add_event(self.root, event)
+
+
+class IndexWatcher:
+    """
+    Watches the source_dirs of crosslinks during 'mkdocs serve', so that their file caches can be reused by the next build.
+    The events are only collected in the background and applied at the start of the next build,
+    so the caches are never modified while a page is being processed.
+    """
+    def __init__(self) -> None:
+        self.observer: Optional[BaseObserver] = None
+        self._lock = threading.Lock()
+        # Absolute source_dir -> relative paths of files that were created/deleted/moved since the last build
+        self._changed_files: dict[str, set[str]] = {}
+        # Absolute source_dirs where directories were changed. Their caches are created from scratch
+        self._dirty_roots: set[str] = set()
+        self._watched_roots: set[str] = set()
+
+    def start(self) -> None:
+        if not self.observer:
+            self.observer = Observer()
+            self.observer.start()
+
+    def stop(self) -> None:
+        if self.observer:
+            self.observer.stop()
+            self.observer.join()
+            self.observer = None
+            self._watched_roots.clear()
+
+    def watch(self, source_dir: Path) -> None:
+        root = os.path.abspath(source_dir)
+        if self.observer and root not in self._watched_roots:
+            try:
+                self.observer.schedule(_EventCollector(self, root), root, recursive=True)
+                self._watched_roots.add(root)
+                debug("Watching '%s' for changes", root)
+            except Exception as ex:
+                # For example if the inotify watch limit is reached. The cache will just be recreated on every build
+                warning(f"Can not watch '{root}' for changes, its index will be recreated on every build: {ex}")
+
+    def add_event(self, root: str, event: FileSystemEvent) -> None:
+        with self._lock:
+            if event.is_directory:
+                # A directory was created/deleted/renamed. This may affect lots of files, so we just index it again
+                self._dirty_roots.add(root)
+            else:
+                changed_files = self._changed_files.setdefault(root, set())
+                for path in [event.src_path, getattr(event, "dest_path", "")]:
+                    if path:
+                        relative_path = os.path.relpath(os.fsdecode(path), root)
+                        if not relative_path.startswith(".."):
+                            # Not moved outside of the watched directory
+                            changed_files.add(normalize_path_str(relative_path))
+
+    def update_caches(self, caches: dict[str, FileCache], old_crosslinks: dict[str, CrosslinkSite],
+                      new_crosslinks: dict[str, CrosslinkSite]) -> dict[str, FileCache]:
+        """
+        Applies the collected changes to the caches of the previous build and returns the ones that can be reused.
+        Caches are not reused if the crosslink's configuration changed or its source_dir could not be updated incrementally.
+        """
+        with self._lock:
+            changed_files, self._changed_files = self._changed_files, {}
+            dirty_roots, self._dirty_roots = self._dirty_roots, set()
+
+        reusable_caches = {}
+        for name, cache in caches.items():
+            root = os.path.abspath(cache.files_root)
+            if old_crosslinks.get(name) != new_crosslinks.get(name):
+                debug("Configuration of crosslink '%s' changed, it needs to be indexed again", name)
+            elif root not in self._watched_roots or root in dirty_roots:
+                debug("Crosslink '%s' can not be updated incrementally, it needs to be indexed again", name)
+            else:
+                for relative_path in changed_files.get(root, []):
+                    # The events may be outdated (like a file that was created and deleted again), so we check the current state
+                    if os.path.isfile(os.path.join(root, relative_path)):
+                        cache.add_file(relative_path)
+                    else:
+                        cache.remove_file(relative_path)
+                reusable_caches[name] = cache
+        return reusable_caches
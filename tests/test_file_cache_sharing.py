@@ -0,0 +1,36 @@
+from pathlib import Path
+# pip dependencies
+from mkdocs_crosslink_plugin.config import CrosslinkPluginConfig, CrosslinkSite
+from mkdocs_crosslink_plugin.replacer import Replacer
+
+
+def create_replacer(crosslinks: list[CrosslinkSite], cache_dir: Path) -> Replacer:
+    config = CrosslinkPluginConfig()
+    config.load_dict({"cache_dir": str(cache_dir), "index_workers": 4})
+    config.validate()
+    return Replacer(crosslinks, config)
+
+
+def test_crosslinks_with_the_same_source_dir_share_the_file_cache(tmp_path: Path) -> None:
+    source_dir = tmp_path / "docs"
+    (source_dir / "guide").mkdir(parents=True)
+    (source_dir / "index.md").write_text("# Index")
+    (source_dir / "guide" / "install.md").write_text("# Install")
+    cache_dir = tmp_path / "cache"
+    crosslinks = [
+        CrosslinkSite("alpha", source_dir, "/site_a/", False),
+        CrosslinkSite("alpha:2", source_dir, "/site_a/", True),
+        # The same directory written differently
+        CrosslinkSite("alpha-3", source_dir / "guide" / "..", "/site_a", True),
+    ]
+
+    # Several builds, since the second one updates the snapshot written by the first one
+    for _ in range(3):
+        replacer = create_replacer(crosslinks, cache_dir)
+        replacer.create_file_caches(["alpha", "alpha:2", "alpha-3"])
+        assert replacer.caches["alpha"] is replacer.caches["alpha:2"] is replacer.caches["alpha-3"]
+        assert replacer.caches["alpha"].has_file("guide/install.md")
+        (source_dir / "new.md").touch()
+
+    # One snapshot for the directory and no temporary files left behind
+    assert [path.suffix for path in cache_dir.iterdir()] == [".json"]